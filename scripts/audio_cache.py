@@ -0,0 +1,142 @@
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import time
+import uuid
+from metrics import metrics
+
+DEFAULT_CACHE_DIR = "../cache/audio"
+DEFAULT_MAX_BYTES = 2 * 1024**3  # 2 GB
+
+class AudioCache:
+    """
+    Content-addressed on-disk cache of generated clips.
+    A clip is keyed by everything that determines it: prompt, duration, model id and generation params/seed.
+    The index is a SQLite database, so several scripts can share one cache safely; clip files are
+    written to a temp name and renamed into place, so readers never see half-written audio.
+    When the cache grows past max_bytes the least recently used clips are evicted.
+    """
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, link=False):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        # Hard-link hits instead of copying (only safe if outputs are never modified in place)
+        self.link = link
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS clips ("
+                "key TEXT PRIMARY KEY, size INTEGER, created REAL, last_used REAL)"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER)")
+
+    def _connect(self):
+        # timeout: wait for other processes holding the write lock instead of failing
+        return sqlite3.connect(os.path.join(self.cache_dir, "index.sqlite"), timeout=30)
+
+    @staticmethod
+    def make_key(prompt, duration, model_id, params=None):
+        """Returns the cache key (a SHA-256 hex digest) for one clip."""
+        payload = json.dumps(
+            {"prompt": prompt, "duration": duration, "model": model_id, "params": params or {}},
+            sort_keys=True,
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.wav")
+
+    def _count(self, conn, name):
+        conn.execute(
+            "INSERT INTO counters (name, value) VALUES (?, 1) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + 1",
+            (name,),
+        )
+
+    def get(self, key, filename):
+        """Copies (or links) the cached clip to filename. Returns False on a miss."""
+        path = self._path(key)
+        with self._connect() as conn:
+            found = conn.execute("SELECT 1 FROM clips WHERE key = ?", (key,)).fetchone()
+            if found:
+                try:
+                    self._deliver(path, filename)
+                except FileNotFoundError:
+                    # Evicted by another process between the lookup and the copy
+                    found = None
+            if found:
+                conn.execute("UPDATE clips SET last_used = ? WHERE key = ?", (time.time(), key))
+                self._count(conn, "hits")
+                self.hits += 1
+                metrics.inc("brainwave_cache_requests_total", result="hit")
+                return True
+            self._count(conn, "misses")
+            self.misses += 1
+            metrics.inc("brainwave_cache_requests_total", result="miss")
+            return False
+
+    def _deliver(self, path, filename):
+        # Write next to the target and rename, so filename is replaced atomically
+        tmp_name = f"{filename}.{uuid.uuid4().hex}.tmp"
+        try:
+            if self.link:
+                try:
+                    os.link(path, tmp_name)
+                except OSError:
+                    shutil.copyfile(path, tmp_name)
+            else:
+                shutil.copyfile(path, tmp_name)
+            os.replace(tmp_name, filename)
+        finally:
+            if os.path.exists(tmp_name):
+                os.remove(tmp_name)
+
+    def put(self, key, filename):
+        """Stores a copy of the clip at filename under key, then evicts old clips if over max_bytes."""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_name = f"{path}.{uuid.uuid4().hex}.tmp"
+        shutil.copyfile(filename, tmp_name)
+        os.replace(tmp_name, path)
+
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO clips (key, size, created, last_used) VALUES (?, ?, ?, ?)",
+                (key, os.path.getsize(path), now, now),
+            )
+            self._evict(conn)
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM clips").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in conn.execute("SELECT key, size FROM clips ORDER BY last_used").fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM clips WHERE key = ?", (key,))
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+            total -= size
+            self._count(conn, "evictions")
+
+    def stats(self):
+        """Hit/miss counters of this process and of the cache as a whole."""
+        with self._connect() as conn:
+            counters = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+            entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM clips").fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "total_hits": counters.get("hits", 0),
+            "total_misses": counters.get("misses", 0),
+            "evictions": counters.get("evictions", 0),
+            "entries": entries,
+            "bytes": size,
+        }
@@ -0,0 +1,214 @@
+import math
+import struct
+from collections import namedtuple
+import numpy as np
+
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_IEEE_FLOAT = 3
+
+# How generated clips are written, from $BRAINWAVE_AUDIO (comma separated, any order), e.g.
+#   int16,mono,rate=16000,loudness=-16
+#   float32 / int16     sample format (int16 is TPDF dithered unless "nodither" is given)
+#   mono                downmix to one channel
+#   rate=<Hz>           resample (polyphase) before writing
+#   loudness=<dBFS>     normalize the RMS level, with peaks kept below -1 dBFS
+AUDIO_FORMAT_ENV = "BRAINWAVE_AUDIO"
+SAMPLE_FORMATS = ("float32", "int16")
+PEAK_CEILING_DB = -1.0
+WRITE_BLOCK = 65536  # samples converted and written at a time
+
+class OutputFormat(namedtuple("OutputFormat", ["sample_format", "sampling_rate", "channels", "loudness", "dither"])):
+    """Output settings for a clip; None means "as the model made it" (rate, channels) or "off" (loudness)."""
+    __slots__ = ()
+
+    @classmethod
+    def parse(cls, spec):
+        sample_format, sampling_rate, channels, loudness, dither = "float32", None, None, None, True
+        for token in (spec or "").replace(" ", "").split(","):
+            name, _, value = token.partition("=")
+            if not name:
+                continue
+            if name in SAMPLE_FORMATS and not value:
+                sample_format = name
+            elif name == "mono" and not value:
+                channels = 1
+            elif name == "nodither" and not value:
+                dither = False
+            elif name == "rate" and value:
+                sampling_rate = int(value)
+            elif name == "loudness" and value:
+                loudness = float(value)
+            else:
+                raise ValueError(f"Unknown audio output option {token!r} in {spec!r}")
+        return cls(sample_format, sampling_rate, channels, loudness, dither)
+
+    def __str__(self):
+        """The canonical spec (parse(str(fmt)) == fmt)."""
+        parts = [self.sample_format]
+        if self.channels == 1:
+            parts.append("mono")
+        if self.sampling_rate:
+            parts.append(f"rate={self.sampling_rate}")
+        if self.loudness is not None:
+            parts.append(f"loudness={self.loudness:g}")
+        if not self.dither and self.sample_format == "int16":
+            parts.append("nodither")
+        return ",".join(parts)
+
+DEFAULT_FORMAT = OutputFormat.parse("")
+
+class WavStreamWriter:
+    """
+    Writes a WAV file incrementally, chunk by chunk.
+    The header sizes are patched after every chunk, so the file on disk is always a valid WAV
+    of the audio written so far (a player can start on it before generation finishes).
+    Chunks are float, shape (samples,) or (samples, channels); with channels=1 multi-channel chunks
+    are downmixed. sample_format "int16" writes 16-bit PCM (TPDF dithered), "float32" IEEE float.
+    """
+    def __init__(self, filename, sampling_rate, channels=1, sample_format="float32", dither=True):
+        if sample_format not in SAMPLE_FORMATS:
+            raise ValueError(f"Unknown sample format {sample_format!r} (expected one of {', '.join(SAMPLE_FORMATS)})")
+        self.filename = filename
+        self.sampling_rate = sampling_rate
+        self.channels = channels
+        self.sample_format = sample_format
+        self.sample_width = 2 if sample_format == "int16" else 4
+        # Fixed seed: the same audio always gives the same file
+        self._dither = np.random.default_rng(0) if dither and sample_format == "int16" else None
+        self.frames = 0
+        self._file = open(filename, "wb")
+        self._write_header()
+
+    def _write_header(self):
+        block_align = self.channels * self.sample_width
+        if self.sample_format == "int16":
+            fmt = struct.pack(
+                "<HHIIHH", WAVE_FORMAT_PCM, self.channels, self.sampling_rate,
+                self.sampling_rate * block_align, block_align, 16,
+            )
+        else:
+            fmt = struct.pack(
+                "<HHIIHHH",
+                WAVE_FORMAT_IEEE_FLOAT,
+                self.channels,
+                self.sampling_rate,
+                self.sampling_rate * block_align,
+                block_align,
+                32,
+                0,  # cbSize
+            )
+        f = self._file
+        f.write(b"RIFF" + struct.pack("<I", 0) + b"WAVE")
+        f.write(b"fmt " + struct.pack("<I", len(fmt)) + fmt)
+        self._fact_offset = None
+        if self.sample_format != "int16":
+            # Non-PCM formats carry a fact chunk with the frame count
+            f.write(b"fact" + struct.pack("<I", 4))
+            self._fact_offset = f.tell()
+            f.write(struct.pack("<I", 0))
+        f.write(b"data")
+        self._data_size_offset = f.tell()
+        f.write(struct.pack("<I", 0))
+        self._data_offset = f.tell()
+
+    def write(self, samples, gain=1.0):
+        """Appends a chunk of samples (scaled by gain) and patches the header."""
+        samples = np.asarray(samples)
+        if samples.ndim == 1:
+            samples = samples[:, None]
+        if samples.shape[1] != self.channels:
+            if self.channels != 1:
+                raise ValueError(f"Expected {self.channels} channels, got {samples.shape[1]}")
+            samples = samples.mean(axis=1, keepdims=True)
+
+        self._file.seek(0, 2)
+        if self.sample_format == "int16":
+            # Scale, dither (triangular, +-1 LSB), round and clip in one float32 buffer the size of the chunk
+            data = np.multiply(samples, gain * 32767.0, dtype=np.float32)
+            if self._dither is not None:
+                data += self._dither.random(data.shape, dtype=np.float32)
+                data -= self._dither.random(data.shape, dtype=np.float32)
+            np.rint(data, out=data)
+            np.clip(data, -32768, 32767, out=data)
+            self._file.write(data.astype("<i2").tobytes())
+        else:
+            if gain != 1.0:
+                samples = np.multiply(samples, gain, dtype=np.float32)
+            self._file.write(np.ascontiguousarray(samples, dtype="<f4").tobytes())
+        self.frames += len(samples)
+        self._patch_header()
+
+    def _patch_header(self):
+        data_size = self.frames * self.channels * self.sample_width
+        f = self._file
+        f.seek(4)
+        f.write(struct.pack("<I", self._data_offset - 8 + data_size))
+        if self._fact_offset is not None:
+            f.seek(self._fact_offset)
+            f.write(struct.pack("<I", self.frames))
+        f.seek(self._data_size_offset)
+        f.write(struct.pack("<I", data_size))
+        f.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._patch_header()
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+def loudness_gain(audio, target_db, ceiling_db=PEAK_CEILING_DB):
+    """Gain that brings audio's RMS level to target_db dBFS, reduced if the peak would pass ceiling_db."""
+    rms = math.sqrt(float(np.mean(np.square(audio, dtype=np.float64)))) if audio.size else 0.0
+    peak = float(np.max(np.abs(audio))) if audio.size else 0.0
+    if rms == 0.0:
+        return 1.0
+    gain = 10 ** (target_db / 20) / rms
+    return min(gain, 10 ** (ceiling_db / 20) / peak)
+
+def resample(audio, from_rate, to_rate):
+    """Polyphase resampling along the last axis (samples)."""
+    if from_rate == to_rate:
+        return audio
+    from scipy.signal import resample_poly
+    divisor = math.gcd(from_rate, to_rate)
+    return resample_poly(audio, to_rate // divisor, from_rate // divisor, axis=-1)
+
+def output_channels(fmt, channels):
+    return 1 if fmt.channels == 1 else channels
+
+def write_wav(filename, audio, sampling_rate, fmt=DEFAULT_FORMAT):
+    """
+    Writes a whole clip, audio shaped (channels, samples) or (samples,), in fmt.
+    Downmix and resampling make new (smaller) arrays; gain, dithering and the int16 conversion are
+    done WRITE_BLOCK samples at a time, so there is no transposed or converted full-size copy.
+    Returns the sampling rate written.
+    """
+    audio = np.asarray(audio)
+    if audio.ndim == 1:
+        audio = audio[None, :]
+    if fmt.channels == 1 and audio.shape[0] > 1:
+        audio = audio.mean(axis=0, keepdims=True)
+    if fmt.sampling_rate and fmt.sampling_rate != sampling_rate:
+        audio = resample(audio, sampling_rate, fmt.sampling_rate)
+        sampling_rate = fmt.sampling_rate
+    gain = 1.0 if fmt.loudness is None else loudness_gain(audio, fmt.loudness)
+
+    with WavStreamWriter(filename, sampling_rate, audio.shape[0], fmt.sample_format, fmt.dither) as writer:
+        for start in range(0, audio.shape[1], WRITE_BLOCK):
+            # (channels, block) -> (block, channels) view, converted by the writer
+            writer.write(audio[:, start:start + WRITE_BLOCK].T, gain)
+    return sampling_rate
+
+def read_wav(filename):
+    """Reads a WAV written here as float32 (samples, channels) plus its sampling rate."""
+    from scipy.io import wavfile
+    sampling_rate, data = wavfile.read(filename)
+    if data.dtype == np.int16:
+        data = data.astype(np.float32) / 32768.0
+    return data.reshape(len(data), -1), sampling_rate
@@ -0,0 +1,183 @@
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from brainwave_core import check_policy, policy_emotion
+from audio_cache import AudioCache
+from eeg_io import is_binary_recording
+from generation_server import make_generator
+from process_csv import analyze_recording, GENERATION_BATCH_SIZE
+
+# Headless version of process_csv.py for many recordings at once: recordings are read, classified
+# and segmented in a process pool, the "I want to feel" answer comes from a mapping file or a policy,
+# and all sessions are generated by one shared generator (local model or generation server).
+
+# Target emotion for sessions the mapping file doesn't name:
+#   dominant         the session's most common emotion
+#   opposite         the opposite corner of the valence/arousal grid (Sad -> Excited, Tense -> Calm, Bored stays)
+#   fixed:<Emotion>  the same emotion for everyone
+DEFAULT_POLICY = "dominant"
+
+# Rollover segments (<name>.part2.csv, ...) are read together with their main file
+_PART_RE = re.compile(r"\.part\d+\.csv$")
+
+def is_recording(path):
+    if os.path.isdir(path):
+        return is_binary_recording(path)
+    return path.endswith(".csv") and not _PART_RE.search(path)
+
+def find_recordings(inputs):
+    """Expands files, directories and glob patterns into recording paths (CSV files and binary recordings)."""
+    recordings = []
+    for pattern in inputs:
+        if os.path.isdir(pattern) and not is_binary_recording(pattern):
+            candidates = [os.path.join(pattern, name) for name in sorted(os.listdir(pattern))]
+        else:
+            candidates = sorted(glob.glob(pattern)) or [pattern]
+        for path in candidates:
+            if is_recording(path) and path not in recordings:
+                recordings.append(path)
+    return recordings
+
+def recording_name(path):
+    """"../data/eeg_data_20251122_144953.csv" -> "eeg_data_20251122_144953"."""
+    return os.path.splitext(os.path.basename(os.path.normpath(path)))[0]
+
+def load_targets(path):
+    """
+    Reads the mapping file: a JSON object from recording name (file name without extension) or
+    "<name>#<session number>" to the emotion to aim for, e.g.
+    {"eeg_data_20251122_144953": "Calm", "eeg_data_20251122_144953#3": "Happy"}
+    """
+    if not path:
+        return {}
+    with open(path) as f:
+        targets = json.load(f)
+    if not isinstance(targets, dict):
+        raise ValueError(f"{path}: expected a JSON object of recording -> emotion")
+    return targets
+
+def target_emotion(name, session, session_emotions, targets, policy):
+    explicit = targets.get(f"{name}#{session.number}") or targets.get(name)
+    if explicit:
+        return explicit.strip().capitalize()
+    return policy_emotion(policy, session_emotions)
+
+def analyze_all(recordings, workers):
+    """Runs analyze_recording over every recording in a process pool; returns {path: (rows, sessions)}."""
+    results = {}
+    # spawn, not fork: the generator may already be loading the model in a background thread
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        futures = {pool.submit(analyze_recording, path): path for path in recordings}
+        for done, future in enumerate(as_completed(futures), 1):
+            path = futures[future]
+            try:
+                rows, sessions = future.result()
+            except Exception as e:
+                print(f"[{done}/{len(recordings)}] {path}: failed ({e})")
+                continue
+            results[path] = (rows, sessions)
+            print(f"[{done}/{len(recordings)}] {path}: {rows} data points, {len(sessions)} sessions")
+    return results
+
+def process_batch(recordings, policy=DEFAULT_POLICY, targets=None, output_dir="../radios", workers=None,
+                  duration=20, batch_size=GENERATION_BATCH_SIZE, dry_run=False, manifest=None):
+    """Generates music for every session of every recording, without asking anything."""
+    targets = targets or {}
+    workers = max(1, min(workers or os.cpu_count() or 1, len(recordings)))
+    os.makedirs(output_dir, exist_ok=True)
+
+    # The model loads in the background while the recordings are analyzed
+    # (or a running generation server is used, see generation_server.py)
+    generator = None if dry_run else make_generator(cache=AudioCache(), background=True)
+
+    print(f"Analyzing {len(recordings)} recordings with {workers} processes...")
+    started = time.perf_counter()
+    results = analyze_all(recordings, workers)
+    print(f"Analyzed in {time.perf_counter() - started:.1f}s\n")
+
+    filename_counts = {}
+    jobs = []  # one entry per session, in recording order
+    for path in recordings:
+        if path not in results:
+            continue
+        name = recording_name(path)
+        for session, session_emotions in results[path][1]:
+            unique_emotions = session_emotions.unique_emotions()
+            target = target_emotion(name, session, session_emotions, targets, policy)
+
+            emotions_str = "_".join([e.lower() for e in unique_emotions])
+            base_name = f"{name}_session{session.number}_{emotions_str}_{target.lower()}"
+            if base_name in filename_counts:
+                filename_counts[base_name] += 1
+                filename = os.path.join(output_dir, f"{base_name}_{filename_counts[base_name]}.wav")
+            else:
+                filename_counts[base_name] = 0
+                filename = os.path.join(output_dir, f"{base_name}.wav")
+
+            print(f"{name} session {session.number}: {unique_emotions} -> {target}")
+            jobs.append({
+                "recording": path,
+                "session": session.number,
+                "rows": [session.start, session.end],
+                "complete": session.complete,
+                "emotions": unique_emotions + [target],
+                "filename": filename,
+            })
+
+    if manifest:
+        with open(manifest, "w") as f:
+            json.dump(jobs, f, indent=1)
+        print(f"\nJob list written to {manifest}")
+
+    if not jobs:
+        print("No sessions found.")
+        return jobs
+    if dry_run:
+        print(f"\nDry run: {len(jobs)} sessions would be generated")
+        return jobs
+
+    print(f"\nGenerating music for {len(jobs)} sessions (batches of {batch_size})...")
+    generator.generate_batch(
+        [job["emotions"] for job in jobs],
+        duration=duration,
+        filenames=[job["filename"] for job in jobs],
+        batch_size=batch_size,
+    )
+    print(f"Processed {len(jobs)} sessions from {len(results)} recordings!")
+    return jobs
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate music for every session of many recordings, unattended.")
+    parser.add_argument("inputs", nargs="+", help="recording files, directories or glob patterns (quote globs)")
+    parser.add_argument("--policy", type=check_policy, default=DEFAULT_POLICY,
+                        help="target emotion when the mapping file has none: dominant, opposite or fixed:<Emotion>")
+    parser.add_argument("--targets", help='JSON mapping {"<recording>": "Calm", "<recording>#<session>": "Happy"}')
+    parser.add_argument("--output", default="../radios", help="folder for the generated files")
+    parser.add_argument("--workers", type=int, help="analysis processes (default: one per CPU)")
+    parser.add_argument("--duration", type=int, default=20, help="seconds of music per session")
+    parser.add_argument("--batch-size", type=int, default=GENERATION_BATCH_SIZE, help="sessions per model call")
+    parser.add_argument("--manifest", help="write the job list (recording, session, emotions, file) to this JSON file")
+    parser.add_argument("--dry-run", action="store_true", help="analyze and list the jobs without generating")
+    args = parser.parse_args()
+
+    recordings = find_recordings(args.inputs)
+    if not recordings:
+        print(f"No recordings found in: {' '.join(args.inputs)}")
+    else:
+        process_batch(
+            recordings,
+            policy=args.policy,
+            targets=load_targets(args.targets),
+            output_dir=args.output,
+            workers=args.workers,
+            duration=args.duration,
+            batch_size=args.batch_size,
+            dry_run=args.dry_run,
+            manifest=args.manifest,
+        )
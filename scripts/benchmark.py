@@ -0,0 +1,359 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from brainwave_core import EEGProcessor, SessionSegmenter, decode_frame
+from eeg_io import KNOWN_COLUMNS, CHUNK_ROWS, iter_recording_chunks, csv_to_binary
+
+# Reproducible benchmarks of the data path and of generation, written as JSON.
+# Everything runs offline: recordings are synthetic (sample_happy.csv schema), the hub is a local
+# websocket server, and generation uses a tiny randomly initialized MusicGen unless --model is given.
+
+RESULTS_DIR = "../benchmarks"
+SECTIONS = ("import", "classify", "csv", "segment", "parse", "websocket", "generate")
+CSV_SIZES = (1_000, 10_000, 100_000, 1_000_000)  # add 10_000_000 with --sizes (~3 GB of CSV)
+REPEAT = 3  # each measurement keeps the best of REPEAT runs
+SEED = 0
+
+def best_time(fn, repeat=REPEAT):
+    """Best wall time of fn() over `repeat` runs."""
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - started)
+    return min(times)
+
+def synthetic_frame(rows, seed=SEED, session_rows=200, gap_rows=50):
+    """
+    Rows with the sample_happy.csv schema. Band features are random in [0, 1), total power
+    ~1e7-1e10, and p_bad alternates between headphone-on runs and gaps so there are sessions to find.
+    """
+    rng = np.random.default_rng(seed)
+    frame = {}
+    for name in KNOWN_COLUMNS:
+        if name == "time":
+            frame[name] = 1_732_310_000.0 + np.arange(rows) * 0.1
+        elif name.endswith("__total_power"):
+            frame[name] = 10 ** rng.uniform(7, 10, rows)
+        elif name.endswith("__p_bad"):
+            on = (np.arange(rows) % (session_rows + gap_rows)) < session_rows
+            frame[name] = np.where(on, rng.uniform(0, 0.4, rows), rng.uniform(0.6, 1, rows))
+        else:
+            frame[name] = rng.random(rows)
+    return pd.DataFrame(frame)
+
+def write_synthetic_csv(path, rows, chunk_rows=CHUNK_ROWS):
+    """Writes a synthetic recording in chunks, so 1e7 rows don't need to fit in memory at once."""
+    written = 0
+    while written < rows:
+        n = min(chunk_rows, rows - written)
+        frame = synthetic_frame(n, seed=SEED + written)
+        frame["time"] += written * 0.1
+        frame.to_csv(path, mode="a" if written else "w", header=not written, index=False)
+        written += n
+
+def bench_import():
+    """Cold import time of the modules a script starts with (fresh interpreter each run)."""
+    results = {}
+    for label, statement in (
+        ("brainwave_core", "import brainwave_core"),
+        ("musicgen_stack", "import brainwave_core; from transformers import MusicgenForConditionalGeneration"),
+    ):
+        code = f"import time; t = time.perf_counter(); {statement}; print(time.perf_counter() - t)"
+        times = [
+            float(subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout)
+            for _ in range(REPEAT)
+        ]
+        results[f"{label}_seconds"] = min(times)
+    return results
+
+def emotion_changes(codes):
+    """How often the classified emotion changes from one row to the next (per 1000 rows)."""
+    return 1000 * np.count_nonzero(np.diff(codes)) / max(len(codes) - 1, 1)
+
+def bench_classify(scalar_rows=20_000, batch_rows=1_000_000, smoothing=("rolling:8", "ema:8")):
+    processor = EEGProcessor(smoothing="")
+    frame = synthetic_frame(batch_rows)
+    records = frame.head(scalar_rows).to_dict("records")
+
+    def scalar():
+        for row in records:
+            processor.determine_emotion(*processor.extract_features(row))
+
+    scalar_seconds = best_time(scalar, repeat=1)
+    batch_seconds = best_time(lambda: processor.classify_batch(frame))
+    results = {
+        "scalar_rows_per_sec": scalar_rows / scalar_seconds,
+        "batch_rows_per_sec": batch_rows / batch_seconds,
+        "batch_speedup": (batch_rows / batch_seconds) / (scalar_rows / scalar_seconds),
+        "emotion_changes_per_1k_rows": emotion_changes(processor.classify_batch(frame)[2]),
+    }
+    for spec in smoothing:
+        smoothed = EEGProcessor(smoothing=spec)
+
+        def classify():
+            smoothed.reset_smoothing()
+            return smoothed.classify_batch(frame)
+
+        label = spec.replace(":", "")
+        results[f"{label}_batch_rows_per_sec"] = batch_rows / best_time(classify)
+        results[f"{label}_emotion_changes_per_1k_rows"] = emotion_changes(classify()[2])
+    return results
+
+def bench_csv(sizes, tmp_dir):
+    """Rows/sec streaming a recording through iter_recording_chunks, as CSV and as the binary format."""
+    results = {}
+    for rows in sizes:
+        path = os.path.join(tmp_dir, f"synthetic_{rows}.csv")
+        write_synthetic_csv(path, rows)
+        binary_path = os.path.join(tmp_dir, f"synthetic_{rows}.eeg")
+        csv_to_binary(path, binary_path)
+
+        def load(recording):
+            return lambda: sum(len(chunk) for chunk in iter_recording_chunks(recording))
+
+        # Big files are slow enough that one run is representative
+        repeat = 1 if rows >= 1_000_000 else REPEAT
+        csv_seconds = best_time(load(path), repeat=repeat)
+        binary_seconds = best_time(load(binary_path), repeat=repeat)
+        results[str(rows)] = {
+            "csv_rows_per_sec": rows / csv_seconds,
+            "csv_mb_per_sec": os.path.getsize(path) / 1e6 / csv_seconds,
+            "binary_rows_per_sec": rows / binary_seconds,
+        }
+        os.remove(path)
+    return results
+
+def bench_segment(batch_rows=10_000_000, push_rows=200_000):
+    frame = synthetic_frame(push_rows)
+    left, right = frame["Left__p_bad"].to_numpy(), frame["Right__p_bad"].to_numpy()
+    left_big, right_big = np.tile(left, batch_rows // push_rows), np.tile(right, batch_rows // push_rows)
+    segmenter = SessionSegmenter()
+
+    def push():
+        segmenter.reset()
+        for l, r in zip(left.tolist(), right.tolist()):
+            segmenter.push(l, r)
+
+    return {
+        "push_rows_per_sec": push_rows / best_time(push),
+        "batch_rows_per_sec": len(left_big) / best_time(lambda: segmenter.segment(left_big, right_big)),
+    }
+
+def bench_parse(messages=50_000):
+    """Hub messages decoded per second: the old json.loads dict vs decode_frame's EEGFrame."""
+    payloads = [json.dumps(row) for row in synthetic_frame(messages).to_dict("records")]
+
+    def parse(decode):
+        for payload in payloads:
+            decode(payload)
+
+    json_seconds = best_time(lambda: parse(json.loads))
+    frame_seconds = best_time(lambda: parse(decode_frame))
+    return {
+        "json_frames_per_sec": messages / json_seconds,
+        "decode_frames_per_sec": messages / frame_seconds,
+        "decode_speedup": json_seconds / frame_seconds,
+    }
+
+async def _websocket_rate(messages):
+    import websockets
+
+    payloads = [json.dumps(row) for row in synthetic_frame(messages).to_dict("records")]
+
+    async def hub(ws, *args):
+        for payload in payloads:
+            await ws.send(payload)
+
+    async with websockets.serve(hub, "127.0.0.1", 0) as server:
+        port = server.sockets[0].getsockname()[1]
+        processor = EEGProcessor()
+        segmenter = SessionSegmenter()
+        received = 0
+        started = time.perf_counter()
+        # Same per-message work as brainwave_stream.py's receive loop
+        async with websockets.connect(f"ws://127.0.0.1:{port}", max_queue=None) as ws:
+            async for msg in ws:
+                eeg = decode_frame(msg)
+                segmenter.push(eeg.left_p_bad, eeg.right_p_bad)
+                if segmenter.on:
+                    processor.determine_emotion(*processor.extract_features(eeg))
+                received += 1
+                if received == messages:
+                    break
+        return received / (time.perf_counter() - started)
+
+def bench_websocket(messages=20_000):
+    return {"messages_per_sec": max(asyncio.run(_websocket_rate(messages)) for _ in range(REPEAT))}
+
+def build_tiny_musicgen(path):
+    """
+    Saves a tiny randomly initialized MusicGen (and a matching processor) to path, so generation
+    can be benchmarked without downloading anything. Same 50 Hz frame rate and 4 codebooks as musicgen-small,
+    in the codec too, so audio prompts (generate_continuation) work.
+    """
+    import string
+    import torch
+    from tokenizers import Tokenizer, models, pre_tokenizers
+    from transformers import (
+        EncodecConfig, EncodecFeatureExtractor, MusicgenConfig, MusicgenDecoderConfig,
+        MusicgenForConditionalGeneration, MusicgenProcessor, T5Config, T5TokenizerFast,
+    )
+
+    words = ["<pad>", "</s>", "<unk>"] + "a high quality music track want to feel mood".split() + list(string.ascii_lowercase)
+    tokenizer = Tokenizer(models.Unigram([(word, -1.0) for word in words], unk_id=2))
+    tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+    processor = MusicgenProcessor(
+        feature_extractor=EncodecFeatureExtractor(feature_size=1, sampling_rate=1600),
+        tokenizer=T5TokenizerFast(tokenizer_object=tokenizer, pad_token="<pad>", eos_token="</s>", unk_token="<unk>", extra_ids=0),
+    )
+    text_encoder = T5Config(vocab_size=100, d_model=32, d_ff=37, d_kv=8, num_layers=2, num_heads=4)
+    audio_encoder = EncodecConfig(
+        hidden_size=16, num_filters=4, compress=1, upsampling_ratios=[8, 4], codebook_size=64,
+        codebook_dim=16, sampling_rate=1600, num_lstm_layers=1, target_bandwidths=[1.2],
+    )
+    decoder = MusicgenDecoderConfig(
+        vocab_size=64, hidden_size=32, num_hidden_layers=2, num_attention_heads=4, ffn_dim=64,
+        num_codebooks=4, max_position_embeddings=4096, pad_token_id=64, bos_token_id=64,
+    )
+    # The codec's codebooks (bandwidth / (frame rate * bits per code)) must match the decoder's,
+    # or encoding an audio prompt gives codes the decoder can't take
+    assert audio_encoder.num_quantizers == decoder.num_codebooks, (
+        f"codec has {audio_encoder.num_quantizers} codebooks, decoder {decoder.num_codebooks}"
+    )
+    config = MusicgenConfig(text_encoder=text_encoder.to_dict(), audio_encoder=audio_encoder.to_dict(), decoder=decoder.to_dict())
+
+    torch.manual_seed(SEED)
+    model = MusicgenForConditionalGeneration(config).eval()
+    model.generation_config.pad_token_id = 64
+    model.generation_config.decoder_start_token_id = 64
+    model.generation_config.do_sample = True
+    model.generation_config.guidance_scale = 3.0
+    model.save_pretrained(path)
+    processor.save_pretrained(path)
+    return path
+
+def bench_generate(model_name, profiles, tmp_dir, duration=4, batch_sizes=(1, 4)):
+    """Tokens/sec and real-time factor (generation time / audio time) per inference profile."""
+    from brainwave_core import MusicGenerator, EMOTIONS
+
+    results = {}
+    for profile in profiles:
+        with contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            generator = MusicGenerator(model_name, profile=profile)
+            load_seconds = time.perf_counter() - started
+            # First call pays for lazy init (and compilation in the compiled profiles)
+            generator.generate_music([EMOTIONS[0]], duration=1, filename=os.path.join(tmp_dir, "warmup.wav"), seed=SEED)
+
+        results[profile] = {"load_seconds": load_seconds}
+        tokens = int(duration * 50)
+        for batch in batch_sizes:
+            emotion_lists = [[EMOTIONS[i % len(EMOTIONS)], "Calm"] for i in range(batch)]
+            filenames = [os.path.join(tmp_dir, f"clip_{i}.wav") for i in range(batch)]
+            with contextlib.redirect_stdout(io.StringIO()):
+                seconds = best_time(lambda: generator.generate_batch(emotion_lists, duration, filenames, batch_size=batch, seed=SEED))
+            results[profile][f"batch_{batch}"] = {
+                "tokens_per_sec": tokens * batch / seconds,
+                "rtf": seconds / (duration * batch),
+            }
+        del generator
+    return results
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def flatten(results, prefix=""):
+    """{"a": {"b": 1}} -> {"a.b": 1}"""
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        else:
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+def compare(previous, current):
+    """Prints every metric next to a previous run. Higher is better except for *seconds and rtf."""
+    old, new = flatten(previous["results"]), flatten(current["results"])
+    print(f"\nCompared with {previous['meta'].get('commit', '?')[:10]}:")
+    for key in sorted(old.keys() & new.keys()):
+        ratio = new[key] / old[key] if old[key] else float("nan")
+        lower_is_better = key.endswith("seconds") or key.endswith("rtf")
+        regression = ratio > 1.1 if lower_is_better else ratio < 0.9
+        print(f"{'!' if regression else ' '} {key:55s} {old[key]:14.4g} -> {new[key]:14.4g} ({ratio:.2f}x)")
+
+def run(sections, sizes, profiles, model_name):
+    import torch
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="brainwave_bench_") as tmp_dir:
+        for section in sections:
+            print(f"Benchmarking {section}...")
+            started = time.perf_counter()
+            if section == "import":
+                results[section] = bench_import()
+            elif section == "classify":
+                results[section] = bench_classify()
+            elif section == "csv":
+                results[section] = bench_csv(sizes, tmp_dir)
+            elif section == "segment":
+                results[section] = bench_segment()
+            elif section == "parse":
+                results[section] = bench_parse()
+            elif section == "websocket":
+                results[section] = bench_websocket()
+            elif section == "generate":
+                model = model_name or build_tiny_musicgen(os.path.join(tmp_dir, "tiny-musicgen"))
+                results[section] = bench_generate(model, profiles, tmp_dir)
+            print(f"  done in {time.perf_counter() - started:.1f}s")
+
+    meta = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "torch": torch.__version__,
+        "torch_threads": torch.get_num_threads(),
+        "model": model_name or "tiny-random-musicgen",
+    }
+    return {"meta": meta, "results": results}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark ingestion, classification, segmentation and generation.")
+    parser.add_argument("--sections", nargs="+", choices=SECTIONS, default=list(SECTIONS))
+    parser.add_argument("--sizes", nargs="+", type=lambda s: int(float(s)), default=list(CSV_SIZES), help="CSV rows, e.g. 1e3 1e7")
+    parser.add_argument("--profiles", nargs="+", default=["default", "int8"], help="MusicGenerator inference profiles")
+    parser.add_argument("--model", help="benchmark a real checkpoint instead of the tiny random one")
+    parser.add_argument("--output", help=f"JSON file (default: {RESULTS_DIR}/<commit>.json)")
+    parser.add_argument("--compare", help="previous results JSON to compare with")
+    args = parser.parse_args()
+
+    report = run(args.sections, args.sizes, args.profiles, args.model)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{(report['meta']['commit'] or 'results')[:10]}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=1)
+    print(json.dumps(report["results"], indent=1))
+    print(f"Results saved to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
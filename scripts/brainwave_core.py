@@ -1,18 +1,280 @@
+import argparse
 import ast
+import ctypes
+import gc
+import json
 import numpy as np
-from scipy.io import wavfile
 import math
-import torch
-from transformers import pipeline
 import os
+import re
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future
+
+# torch, transformers and scipy are imported where they're used, so importing this module
+# for EEGProcessor / SessionSegmenter costs about as much as NumPy
+
+# The 3x3 valence/arousal grid used by determine_emotion, flattened row by row.
+# Rows: High / Moderate / Low arousal. Columns: Positive / Neutral / Negative valence.
+# The batch API returns indices into this tuple as emotion codes.
+EMOTIONS = (
+    "Excited", "Tense", "Angry",
+    "Happy", "Bored", "Stressed",
+    "Relaxed", "Calm", "Sad",
+)
+EMOTION_CODES = {emotion: code for code, emotion in enumerate(EMOTIONS)}
+
+# Band smoothing before classification, e.g. "rolling:8" or "ema:8" (off when unset)
+SMOOTHING_ENV = "BRAINWAVE_SMOOTHING"
+SMOOTHING_WINDOW = 8  # frames
+
+class FrameError(ValueError):
+    """A hub message that isn't a usable EEG frame."""
+
+class EEGFrame:
+    """
+    The fields of a hub frame the pipeline reads, as a compact record instead of the 27-key dict.
+    Missing fields get the defaults the dict-based code used: 0 for the bands, 1 (headphone off)
+    for p_bad, None for time. get(name, default) mirrors dict.get for code written against the dict.
+    """
+    __slots__ = ("time", "left_alpha", "right_alpha", "left_beta", "right_beta", "left_p_bad", "right_p_bad")
+
+    def __init__(self, time=None, left_alpha=0, right_alpha=0, left_beta=0, right_beta=0, left_p_bad=1, right_p_bad=1):
+        self.time = time
+        self.left_alpha = left_alpha
+        self.right_alpha = right_alpha
+        self.left_beta = left_beta
+        self.right_beta = right_beta
+        self.left_p_bad = left_p_bad
+        self.right_p_bad = right_p_bad
+
+    @classmethod
+    def from_dict(cls, data):
+        get = data.get
+        return cls(
+            get("time"),
+            get("Left__alpha", 0), get("Right__alpha", 0),
+            get("Left__beta", 0), get("Right__beta", 0),
+            get("Left__p_bad", 1), get("Right__p_bad", 1),
+        )
+
+    def get(self, name, default=None):
+        attr = _FRAME_ATTRS.get(name)
+        return default if attr is None else getattr(self, attr)
+
+    def __repr__(self):
+        fields = ", ".join(f"{attr}={getattr(self, attr)!r}" for attr in self.__slots__)
+        return f"EEGFrame({fields})"
+
+# Hub field name -> EEGFrame attribute
+_FRAME_ATTRS = {
+    "time": "time",
+    "Left__alpha": "left_alpha", "Right__alpha": "right_alpha",
+    "Left__beta": "left_beta", "Right__beta": "right_beta",
+    "Left__p_bad": "left_p_bad", "Right__p_bad": "right_p_bad",
+}
+# Fields every frame must carry (time is optional)
+_REQUIRED_FIELDS = tuple(name for name in _FRAME_ATTRS if name != "time")
+# "name": value for the fields above in a flat JSON object, value a whole JSON number (or null / NaN / Infinity)
+_FRAME_FIELD_RE = re.compile(
+    r'"(time|(?:Left|Right)__(?:alpha|beta|p_bad))"\s*:\s*'
+    r'(-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?|null|NaN|-?Infinity)\s*(?=[,}])'
+)
+
+def _looks_flat(msg):
+    """Cheap shape check for {"key": value, ...} with unquoted values and nothing nested."""
+    pairs = msg.count(":")
+    return (
+        pairs > 0 and msg.count('"') == 2 * pairs and msg.count(",") == pairs - 1
+        and msg.count("{") == 1 and msg.count("}") == 1 and "[" not in msg
+    )
+
+def _decode_json(msg):
+    try:
+        data = json.loads(msg)
+    except ValueError as e:
+        raise FrameError(f"bad JSON: {e}") from None
+    missing = [name for name in _REQUIRED_FIELDS if name not in data]
+    if missing:
+        raise FrameError(f"missing {', '.join(missing)}")
+    frame = EEGFrame.from_dict(data)
+    for name, attr in _FRAME_ATTRS.items():
+        value = getattr(frame, attr)
+        if isinstance(value, bool) or not isinstance(value, (int, float)) and not (value is None and name == "time"):
+            raise FrameError(f"{name} is not a number: {value!r}")
+    return frame
+
+def decode_frame(msg):
+    """
+    Decodes one hub message (JSON text) into an EEGFrame, raising FrameError if it's malformed
+    or lacks one of the band / p_bad fields (a frame that silently defaulted to "headphone off"
+    would end the session in progress).
+    Hub frames are flat objects of numbers, so after a cheap check of the text's shape (str.count)
+    the needed fields are read straight from it with one regex pass, without building a dict of all
+    27 keys (~1.2x json.loads with the same checks). Anything else (nested objects, strings, broken
+    text), or a frame where that pass doesn't find every field, goes through json.loads, which also
+    gives the error.
+    """
+    if isinstance(msg, (bytes, bytearray)):
+        msg = msg.decode("utf-8", "replace")
+    msg = msg.strip()
+    if not (msg.startswith("{") and msg.endswith("}")):
+        raise FrameError("not a JSON object")
+    if not _looks_flat(msg):
+        return _decode_json(msg)
+
+    fields = dict(_FRAME_FIELD_RE.findall(msg))
+    try:
+        frame_time = fields.get("time", "null")
+        return EEGFrame(
+            None if frame_time == "null" else float(frame_time),
+            *[float(fields[name]) for name in _REQUIRED_FIELDS],
+        )
+    except (KeyError, ValueError):
+        # A field is missing, null or not a plain number: let json.loads decide (and explain)
+        return _decode_json(msg)
+
+class BandSmoother:
+    """
+    Smooths the four band powers classification uses (left/right alpha, left/right beta) over
+    the last frames, so noise doesn't flip the emotion from frame to frame.
+    - "rolling": mean of the last `window` frames (fewer at the start)
+    - "ema": exponential moving average with weight 2 / (window + 1) for the newest frame
+
+    push() is O(1) per frame on a preallocated ring buffer. smooth_batch() is the vectorized
+    equivalent (cumulative sums / lfilter) and carries the state over between calls, so a
+    recording read in chunks gets the same values as the same frames streamed one by one.
+    Frames with a missing (NaN) band are left out and repeat the previous smoothed value.
+    """
+    METHODS = ("rolling", "ema")
+
+    def __init__(self, method="rolling", window=SMOOTHING_WINDOW):
+        if method not in self.METHODS:
+            raise ValueError(f"Unknown smoothing {method!r} (expected one of {', '.join(self.METHODS)})")
+        if window < 1:
+            raise ValueError("window must be at least 1")
+        self.method = method
+        self.window = int(window)
+        self.alpha = 2 / (self.window + 1)
+        self._ring = np.zeros((self.window, 4))
+        self.reset()
+
+    @classmethod
+    def from_spec(cls, spec):
+        """"rolling", "rolling:16", "ema:8", ... (the $BRAINWAVE_SMOOTHING format)."""
+        method, _, window = spec.partition(":")
+        return cls(method, int(window) if window else SMOOTHING_WINDOW)
+
+    def reset(self):
+        """Forgets the previous frames (e.g. when a new person puts the headphone on)."""
+        self._count = 0  # frames in the ring
+        self._pos = 0    # slot the next frame goes to
+        self._sum = np.zeros(4)
+        self.current = None  # last smoothed bands
+
+    def push(self, bands):
+        """Adds one frame's (l_alpha, r_alpha, l_beta, r_beta) and returns the smoothed bands."""
+        x = np.array(bands, dtype=np.float64)
+        if not np.isfinite(x).all():
+            return self.current if self.current is not None else x
+        if self.method == "ema":
+            self.current = x if self.current is None else self.alpha * x + (1 - self.alpha) * self.current
+            return self.current
+
+        if self._count == self.window:
+            self._sum -= self._ring[self._pos]
+        else:
+            self._count += 1
+        self._ring[self._pos] = x
+        self._sum += x
+        self._pos = (self._pos + 1) % self.window
+        if self._pos == 0:
+            # Once per lap, recompute the sum so rounding errors don't build up
+            self._sum = self._ring[:self._count].sum(axis=0)
+        self.current = self._sum / self._count
+        return self.current
+
+    def smooth_batch(self, bands, restart=None):
+        """
+        Vectorized push() for an (n, 4) block of frames; returns the (n, 4) smoothed bands.
+        restart: optional boolean array, True where smoothing starts afresh (reset() before that row).
+        """
+        bands = np.asarray(bands, dtype=np.float64)
+        out = np.empty_like(bands)
+        bounds = [0, len(bands)]
+        if restart is not None:
+            bounds = sorted(set(np.flatnonzero(restart).tolist()) | set(bounds))
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            if restart is not None and restart[start]:
+                self.reset()
+            out[start:end] = self._smooth_segment(bands[start:end])
+        return out
+
+    def _smooth_segment(self, x):
+        valid = np.isfinite(x).all(axis=1)
+        previous = self.current
+        out = np.empty_like(x)
+        if valid.any():
+            out[valid] = self._smooth_rows(x[valid])
+        if not valid.all():
+            # Missing frames repeat the last smoothed value before them
+            last = np.maximum.accumulate(np.where(valid, np.arange(len(x)), -1))
+            missing = ~valid
+            before = missing & (last < 0)
+            out[missing & ~before] = out[last[missing & ~before]]
+            out[before] = previous if previous is not None else x[before]
+        return out
+
+    def _smooth_rows(self, x):
+        if self.method == "ema":
+            from scipy.signal import lfilter
+            previous = x[0] if self.current is None else self.current
+            smoothed, _ = lfilter([self.alpha], [1, self.alpha - 1], x, axis=0, zi=((1 - self.alpha) * previous)[None, :])
+            self.current = smoothed[-1]
+            return smoothed
+
+        # Rolling mean: prepend the frames still in the window, then difference cumulative sums
+        history = self._ring[(self._pos - self._count + np.arange(self._count)) % self.window]
+        frames = np.concatenate([history, x])
+        sums = np.concatenate([np.zeros((1, 4)), np.cumsum(frames, axis=0)])
+        ends = np.arange(self._count + 1, len(frames) + 1)
+        starts = np.maximum(ends - self.window, 0)
+        smoothed = (sums[ends] - sums[starts]) / (ends - starts)[:, None]
+
+        tail = frames[-self.window:]
+        self._ring[:len(tail)] = tail
+        self._count = len(tail)
+        self._pos = self._count % self.window
+        self._sum = tail.sum(axis=0)
+        self.current = smoothed[-1]
+        return smoothed
 
 class EEGProcessor:
+    def __init__(self, smoothing=None):
+        """
+        smoothing: None (every frame classified on its own), "rolling[:window]" or "ema[:window]"
+        (see BandSmoother); defaults to $BRAINWAVE_SMOOTHING. With smoothing on, frames have to be
+        fed in order, and each stream / headset needs its own EEGProcessor.
+        """
+        if smoothing is None:
+            smoothing = os.environ.get(SMOOTHING_ENV)
+        self.smoother = BandSmoother.from_spec(smoothing) if smoothing else None
+
+    def reset_smoothing(self):
+        if self.smoother is not None:
+            self.smoother.reset()
+
     def parse_input(self, data_str):
-        """Parses the input string into a dictionary."""
+        """Parses the input string into a dictionary (JSON, or a Python dict literal as before)."""
         try:
-            if isinstance(data_str, dict):
+            if isinstance(data_str, (dict, EEGFrame)):
                 return data_str
-            return ast.literal_eval(data_str)
+            try:
+                return json.loads(data_str)
+            except ValueError:
+                # Older recordings / test data use Python reprs ('single quotes')
+                return ast.literal_eval(data_str)
         except Exception as e:
             print(f"Error parsing input: {e}")
             return None
@@ -22,11 +284,18 @@ class EEGProcessor:
         Computes Valence and Arousal from EEG data.
         Calculated based on the paper: Detecting emotions through EEG signals based on modified convolutional fuzzy neural network.
         """
-        l_alpha = data.get('Left__alpha', 0)
-        r_alpha = data.get('Right__alpha', 0)
+        if isinstance(data, EEGFrame):
+            l_alpha, r_alpha = data.left_alpha, data.right_alpha
+            l_beta, r_beta = data.left_beta, data.right_beta
+        else:
+            l_alpha = data.get('Left__alpha', 0)
+            r_alpha = data.get('Right__alpha', 0)
         
-        l_beta = data.get('Left__beta', 0)
-        r_beta = data.get('Right__beta', 0)
+            l_beta = data.get('Left__beta', 0)
+            r_beta = data.get('Right__beta', 0)
+
+        if self.smoother is not None:
+            l_alpha, r_alpha, l_beta, r_beta = self.smoother.push((l_alpha, r_alpha, l_beta, r_beta))
         
         if l_alpha + r_alpha == 0:
             valence = 0
@@ -86,13 +355,596 @@ class EEGProcessor:
             else: # -0.5 <= valence < 0.5
                 return "Calm"     # Neutral V, Low A
 
-from transformers import AutoProcessor, MusicgenForConditionalGeneration
+    def _column(self, data, name, columns, n_rows):
+        """Returns one column of a batch as float64, or zeros if it is missing (like dict.get(name, 0))."""
+        if columns is not None:
+            if name not in columns:
+                return np.zeros(n_rows)
+            return np.asarray(data[:, columns.index(name)], dtype=np.float64)
+        if name not in data:
+            return np.zeros(n_rows)
+        return np.asarray(data[name], dtype=np.float64)
+
+    def extract_features_batch(self, data, columns=None, restart=None):
+        """
+        Vectorized extract_features for a whole block of rows.
+        data is a pandas DataFrame / dict of column arrays, or a 2-D NumPy array with
+        its column names given in columns. Returns (valence, arousal) float64 arrays.
+        With smoothing on, blocks must come in order; restart marks rows where it starts afresh.
+        """
+        if columns is not None:
+            columns = list(columns)
+            n_rows = len(data)
+        elif hasattr(data, "columns"):
+            n_rows = len(data)
+        else:
+            n_rows = max((len(v) for v in data.values()), default=0)
+
+        l_alpha = self._column(data, 'Left__alpha', columns, n_rows)
+        r_alpha = self._column(data, 'Right__alpha', columns, n_rows)
+        l_beta = self._column(data, 'Left__beta', columns, n_rows)
+        r_beta = self._column(data, 'Right__beta', columns, n_rows)
+
+        if self.smoother is not None:
+            smoothed = self.smoother.smooth_batch(np.column_stack([l_alpha, r_alpha, l_beta, r_beta]), restart)
+            l_alpha, r_alpha, l_beta, r_beta = smoothed.T
+
+        # Same zero-division handling as extract_features: 0 where the denominator is 0
+        alpha_sum = l_alpha + r_alpha
+        valence = np.zeros(n_rows)
+        np.divide(r_alpha - l_alpha, alpha_sum, out=valence, where=alpha_sum != 0)
+
+        avg_alpha = alpha_sum / 2
+        avg_beta = (l_beta + r_beta) / 2
+        arousal = np.zeros(n_rows)
+        np.divide(avg_beta, avg_alpha, out=arousal, where=avg_alpha != 0)
+
+        return valence, arousal
+
+    def determine_emotion_batch(self, valence, arousal):
+        """
+        Vectorized determine_emotion. Returns int8 codes indexing EMOTIONS.
+        Uses the same thresholds and comparisons, so NaN falls through to "Calm" as in the scalar path.
+        """
+        valence = np.asarray(valence)
+        arousal = np.asarray(arousal)
+
+        # 0 = High, 1 = Moderate, 2 = Low arousal
+        arousal_row = np.where(arousal >= 1.0, 0, np.where(arousal >= 0.5, 1, 2))
+        # 0 = Positive, 1 = Neutral, 2 = Negative valence
+        valence_col = np.where(valence >= 0.5, 0, np.where(valence < -0.5, 2, 1))
+
+        return (arousal_row * 3 + valence_col).astype(np.int8)
+
+    def classify_batch(self, data, columns=None, restart=None):
+        """Returns (valence, arousal, emotion_codes) for a whole block of rows."""
+        valence, arousal = self.extract_features_batch(data, columns, restart)
+        return valence, arousal, self.determine_emotion_batch(valence, arousal)
+
+class EmotionAggregator:
+    """
+    Running summary of one session's emotions, in constant memory however long the session runs:
+    a count per EMOTIONS code, the first/last frame time and, with dwell=True, the seconds spent in
+    each emotion (the time until the next frame counts towards the current frame's emotion).
+    """
+    def __init__(self, dwell=False):
+        self.dwell = dwell
+        self.reset()
+
+    def reset(self):
+        self.counts = [0] * len(EMOTIONS)
+        self.dwell_seconds = [0.0] * len(EMOTIONS)
+        self.points = 0
+        self.first_time = None
+        self.last_time = None
+        self._last_code = None
+
+    def add(self, emotion, time=None):
+        """Adds one frame's emotion (a name from EMOTIONS or its code)."""
+        code = EMOTION_CODES[emotion] if isinstance(emotion, str) else emotion
+        self.counts[code] += 1
+        self.points += 1
+        if time is not None:
+            if self.first_time is None:
+                self.first_time = time
+            elif self.dwell and time > self.last_time:
+                self.dwell_seconds[self._last_code] += time - self.last_time
+            self.last_time = time
+        self._last_code = code
+
+    def add_codes(self, codes, times=None):
+        """Adds a block of emotion codes at once (e.g. classify_batch output for a session's rows)."""
+        codes = np.asarray(codes)
+        if len(codes) == 0:
+            return
+        for code, count in enumerate(np.bincount(codes, minlength=len(EMOTIONS))):
+            self.counts[code] += int(count)
+        self.points += len(codes)
+        if times is not None:
+            times = np.asarray(times, dtype=np.float64)
+            if self.first_time is None:
+                self.first_time = float(times[0])
+            elif self.dwell and times[0] > self.last_time:
+                self.dwell_seconds[self._last_code] += float(times[0]) - self.last_time
+            if self.dwell:
+                steps = np.maximum(np.diff(times), 0)
+                for code, seconds in enumerate(np.bincount(codes[:-1], weights=steps, minlength=len(EMOTIONS))):
+                    self.dwell_seconds[code] += float(seconds)
+            self.last_time = float(times[-1])
+        self._last_code = int(codes[-1])
+
+    @property
+    def duration(self):
+        """Seconds between the first and last frame (0 without timestamps)."""
+        return 0.0 if self.first_time is None else self.last_time - self.first_time
+
+    def unique_emotions(self):
+        """The emotions seen at least once, in EMOTIONS order."""
+        return [EMOTIONS[code] for code, count in enumerate(self.counts) if count]
+
+    def histogram(self, weighted=None):
+        """{emotion: frames}, or {emotion: seconds} when weighted by dwell time (the default with dwell=True)."""
+        values = self.dwell_seconds if (self.dwell if weighted is None else weighted) else self.counts
+        return {EMOTIONS[code]: value for code, value in enumerate(values) if self.counts[code]}
+
+    def most_common(self, weighted=None):
+        """The dominant emotion, or None for an empty session."""
+        histogram = self.histogram(weighted)
+        return max(histogram, key=histogram.get) if histogram else None
+
+def opposite_emotion(emotion):
+    """Mirrors an emotion through the centre of the 3x3 valence/arousal grid (Sad -> Excited, Tense -> Calm)."""
+    row, column = divmod(EMOTION_CODES[emotion], 3)
+    return EMOTIONS[(2 - row) * 3 + (2 - column)]
+
+def policy_emotion(policy, session_emotions):
+    """
+    The target emotion a policy picks for a session (an EmotionAggregator):
+    "dominant" (its most common emotion), "opposite" (opposite_emotion of that) or "fixed:<Emotion>".
+    """
+    method, _, emotion = policy.partition(":")
+    if method == "fixed" and emotion:
+        return emotion.strip().capitalize()
+    if method in ("dominant", "opposite") and not emotion:
+        dominant = session_emotions.most_common() or "Calm"
+        return opposite_emotion(dominant) if method == "opposite" else dominant
+    raise ValueError(f"Unknown target policy {policy!r} (expected dominant, opposite or fixed:<Emotion>)")
+
+def check_policy(policy):
+    """argparse type for a target policy option."""
+    try:
+        policy_emotion(policy, EmotionAggregator())
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e)) from None
+    return policy
+
+# A person session: rows [start, end) with the headphone on.
+# complete is False if the recording ended while the headphone was still on.
+Session = namedtuple("Session", ["number", "start", "end", "complete"])
+
+# Emitted by SessionSegmenter.push. kind is "start", "end" or "discard" (a run shorter than min_points).
+SessionEvent = namedtuple("SessionEvent", ["kind", "number", "start", "end"])
+
+class SessionSegmenter:
+    """
+    Splits frames into person sessions: a session runs from headphone on to headphone off.
+    The headphone counts as on when either side's p_bad is below on_threshold.
+
+    Optional filters against flapping sessions (each one would trigger a generation):
+    - hysteresis: once on, the headphone only counts as off when neither side is below off_threshold
+    - min_points: runs shorter than this never become sessions
+
+    Session numbering keeps the old quirk: a session already running at the first frame is
+    session 0, later ones are numbered from 1.
+    push() (streaming, O(1)) and segment() (offline, vectorized) give identical boundaries.
+    """
+    def __init__(self, on_threshold=0.5, off_threshold=None, min_points=1):
+        self.on_threshold = on_threshold
+        self.off_threshold = on_threshold if off_threshold is None else off_threshold
+        if self.off_threshold < self.on_threshold:
+            raise ValueError("off_threshold must be >= on_threshold")
+        self.min_points = max(1, min_points)
+        self.reset()
+
+    def reset(self):
+        self.on = False          # headphone state after the last frame
+        self.index = 0           # number of frames pushed
+        self.session_count = 0
+        self.run_start = None    # first row of the current on-run
+        self.run_length = 0
+        self.current = None      # number of the confirmed session in progress
+
+    def headphone_on(self, left_p_bad, right_p_bad):
+        """Updates and returns the headphone state for one frame."""
+        if left_p_bad < self.on_threshold or right_p_bad < self.on_threshold:
+            self.on = True
+        elif not (left_p_bad < self.off_threshold or right_p_bad < self.off_threshold):
+            self.on = False
+        return self.on
+
+    def headphone_on_batch(self, left_p_bad, right_p_bad):
+        """Vectorized headphone_on for a block of frames; the state carries over between blocks."""
+        left_p_bad = np.asarray(left_p_bad)
+        right_p_bad = np.asarray(right_p_bad)
+        on = (left_p_bad < self.on_threshold) | (right_p_bad < self.on_threshold)
+        if self.off_threshold != self.on_threshold:
+            off = ~((left_p_bad < self.off_threshold) | (right_p_bad < self.off_threshold))
+            # In the dead band the previous state holds: forward-fill the last decided frame
+            decided = np.where(on | off, np.arange(len(on)), -1)
+            np.maximum.accumulate(decided, out=decided)
+            on = np.where(decided >= 0, on[np.maximum(decided, 0)], self.on)
+        if len(on):
+            self.on = bool(on[-1])
+        return on
+
+    def push(self, left_p_bad, right_p_bad):
+        """Feeds one frame. Returns a SessionEvent or None."""
+        idx = self.index
+        self.index += 1
+        was_on = self.on
+        on = self.headphone_on(left_p_bad, right_p_bad)
+        
+        if on:
+            if not was_on:
+                self.run_start = idx
+                self.run_length = 0
+            self.run_length += 1
+            if self.run_length == self.min_points:
+                if self.run_start == 0:
+                    number = 0
+                else:
+                    self.session_count += 1
+                    number = self.session_count
+                self.current = number
+                return SessionEvent("start", number, self.run_start, None)
+        elif was_on:
+            if self.current is not None:
+                event = SessionEvent("end", self.current, self.run_start, idx)
+            else:
+                event = SessionEvent("discard", None, self.run_start, idx)
+            self.current = None
+            self.run_start = None
+            return event
+        return None
+
+    def finish(self):
+        """Returns the session still in progress (as an incomplete Session), or None."""
+        if self.current is None:
+            return None
+        return Session(self.current, self.run_start, self.index, False)
+
+    def find_sessions(self, on):
+        """Run-length detection over a boolean headphone-on array. Returns a list of Session."""
+        on = np.asarray(on, dtype=np.int8)
+        edges = np.diff(np.concatenate(([0], on, [0])))
+        starts = np.flatnonzero(edges == 1)
+        ends = np.flatnonzero(edges == -1)
+        
+        keep = (ends - starts) >= self.min_points
+        starts, ends = starts[keep], ends[keep]
+        numbers = np.arange(1, len(starts) + 1)
+        if len(starts) and starts[0] == 0:
+            numbers -= 1
+        
+        n_rows = len(on)
+        return [
+            Session(int(number), int(start), int(end), bool(end < n_rows))
+            for number, start, end in zip(numbers, starts, ends)
+        ]
+
+    def segment(self, left_p_bad, right_p_bad):
+        """Offline mode: all sessions of a recording in one vectorized pass."""
+        self.reset()
+        return self.find_sessions(self.headphone_on_batch(left_p_bad, right_p_bad))
+
+from audio_io import AUDIO_FORMAT_ENV, DEFAULT_FORMAT, OutputFormat, WavStreamWriter, output_channels, read_wav, write_wav
+from metrics import metrics
+
+# Histogram of each generation stage's duration, labelled by stage
+STAGE_METRIC = "brainwave_generation_stage_seconds"
+
+MODEL_NAME = "facebook/musicgen-small"
+
+# CPU inference profiles, chosen with MusicGenerator(profile=...) or the BRAINWAVE_PROFILE environment variable.
+# quantize: dynamic int8 quantization of the decoder's linear layers (smaller, faster matmuls; audio differs slightly)
+# compile: torch.compile the decoder (slow first call, faster after)
+# threads / interop_threads: torch intra-op / inter-op threads (None keeps torch's default);
+# BRAINWAVE_THREADS / BRAINWAVE_INTEROP_THREADS override them for any profile
+# dtype: weight dtype ("bfloat16" halves the weights' memory; audio differs slightly)
+INFERENCE_PROFILES = {
+    "default": {"quantize": False, "compile": False, "threads": None, "interop_threads": None, "dtype": None},
+    "int8": {"quantize": True, "compile": False, "threads": None, "interop_threads": None, "dtype": None},
+    "compiled": {"quantize": False, "compile": True, "threads": None, "interop_threads": None, "dtype": None},
+    "int8-compiled": {"quantize": True, "compile": True, "threads": None, "interop_threads": None, "dtype": None},
+    "bf16": {"quantize": False, "compile": False, "threads": None, "interop_threads": None, "dtype": "bfloat16"},
+}
+
+def release_memory():
+    """Collects garbage and asks glibc to hand freed heap pages back to the OS (lowers RSS)."""
+    gc.collect()
+    try:
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass  # not glibc
+
+class AudioChunkStreamer:
+    """
+    Decodes MusicGen tokens to audio while model.generate is still running.
+    It is passed as a logits processor, which sees all tokens so far at every step (and leaves the scores
+    untouched). Every play_steps steps, the delay pattern is undone on the tokens so far, they are decoded
+    with the audio encoder, and the new audio goes to on_audio, minus a short stride that is held back
+    because the next decode can still change it. finish() emits the rest from generate's final output.
+    """
+    def __init__(self, model, on_audio, play_steps=100):
+        self.decoder = model.decoder
+        self.audio_encoder = model.audio_encoder
+        self.generation_config = model.generation_config
+        self.on_audio = on_audio
+        self.play_steps = play_steps
+        hop_length = int(np.prod(self.audio_encoder.config.upsampling_ratios))
+        self.stride = max(0, hop_length * (play_steps - self.decoder.num_codebooks) // 6)
+        self.emitted = 0  # samples already passed to on_audio
+
+    def _decode(self, token_ids):
+        """Returns all audio decoded so far, shape (channels, samples)."""
+        import torch
+        num_codebooks = self.decoder.num_codebooks
+        _, delay_pattern_mask = self.decoder.build_delay_pattern_mask(
+            token_ids[:, :1],
+            pad_token_id=self.generation_config.decoder_start_token_id,
+            max_length=token_ids.shape[-1],
+        )
+        input_ids = self.decoder.apply_delay_pattern_mask(token_ids, delay_pattern_mask)
+        input_ids = input_ids[input_ids != self.generation_config.pad_token_id].reshape(1, num_codebooks, -1)
+        input_ids = input_ids[None, ...].to(self.audio_encoder.device)
+        if self.decoder.config.audio_channels == 2:
+            # Left/right codebooks are interleaved
+            channels = [input_ids[:, :, ::2, :], input_ids[:, :, 1::2, :]]
+        else:
+            channels = [input_ids]
+        audio = [self.audio_encoder.decode(ids, audio_scales=[None]).audio_values[0, 0] for ids in channels]
+        return torch.stack(audio).cpu().float().numpy()
+
+    def __call__(self, input_ids, scores):
+        num_codebooks = self.decoder.num_codebooks
+        if input_ids.shape[0] != num_codebooks:
+            raise ValueError("Streaming generation supports one prompt at a time")
+
+        steps = input_ids.shape[-1]
+        # Wait until every codebook has a token past the delay pattern
+        if steps > num_codebooks and steps % self.play_steps == 0:
+            audio = self._decode(input_ids)
+            end = audio.shape[-1] - self.stride
+            if end > self.emitted:
+                self.on_audio(audio[:, self.emitted:end])
+                self.emitted = end
+        return scores
+
+    def finish(self, audio_values):
+        """Emits what's left of the final clip, audio_values shaped (channels, samples)."""
+        audio = audio_values.cpu().float().numpy()
+        if audio.shape[-1] > self.emitted:
+            self.on_audio(audio[:, self.emitted:])
+            self.emitted = audio.shape[-1]
 
 class MusicGenerator:
-    def __init__(self):
-        print("Loading MusicGen model... this might take a while...")
-        self.processor = AutoProcessor.from_pretrained("facebook/musicgen-small")
-        self.model = MusicgenForConditionalGeneration.from_pretrained("facebook/musicgen-small")
+    def __init__(self, model_name=MODEL_NAME, cache=None, background=False, profile=None, low_memory=None, output_format=None):
+        """
+        cache: an AudioCache; clips already rendered for the same prompt/settings are served from it.
+        background: load the model in a background thread and return right away. `ready` is a Future
+        that completes when the model is loaded; generation waits on it.
+        profile: a key of INFERENCE_PROFILES (default: $BRAINWAVE_PROFILE, else "default").
+        low_memory: keep peak RSS down (default: $BRAINWAVE_LOW_MEMORY=1). Weights are loaded without an
+        extra fp32 copy, and prompts go through cached text-encoder embeddings, so free_text_encoder()
+        can drop the text encoder once the prompts a process needs are cached (see cache_prompts).
+        output_format: how clips are written, an OutputFormat or spec like "int16,mono,rate=16000"
+        (default: $BRAINWAVE_AUDIO, else float32 as generated; see audio_io).
+        """
+        self.model_name = model_name
+        if output_format is None:
+            output_format = os.environ.get(AUDIO_FORMAT_ENV)
+        if not isinstance(output_format, OutputFormat):
+            output_format = OutputFormat.parse(output_format)
+        self.output_format = output_format
+        self.cache = cache
+        self.profile = profile or os.environ.get("BRAINWAVE_PROFILE", "default")
+        if self.profile not in INFERENCE_PROFILES:
+            raise ValueError(f"Unknown profile {self.profile!r}, expected one of {list(INFERENCE_PROFILES)}")
+        self.last_rtf = None  # real-time factor of the last generate call
+        if low_memory is None:
+            low_memory = os.environ.get("BRAINWAVE_LOW_MEMORY") == "1"
+        self.low_memory = low_memory
+        self._prompt_embeddings = {}  # prompt -> text encoder hidden states (low_memory mode)
+        self._text_encoder_freed = False
+        self._model = None
+        self._processor = None
+        self._lock = threading.RLock()
+        self.ready = Future()
+        if background:
+            threading.Thread(target=self._load, name="musicgen-load", daemon=True).start()
+        else:
+            self._load()
+            self.ready.result()  # raise loading errors here
+
+    def _load(self):
+        """Loads the model unless it is already loaded (or failed to load)."""
+        with self._lock:
+            if self.ready.done():
+                return
+            print("Loading MusicGen model... this might take a while...")
+            started = time.time()
+            try:
+                import torch
+                from transformers import AutoProcessor, MusicgenForConditionalGeneration
+                self._apply_threads()
+                load_kwargs = {}
+                if self.low_memory:
+                    # Build the model on the meta device and fill it from the (mmap'd) safetensors file,
+                    # instead of initializing random fp32 weights and copying the checkpoint over them
+                    load_kwargs["low_cpu_mem_usage"] = True
+                dtype = INFERENCE_PROFILES[self.profile]["dtype"]
+                if dtype:
+                    load_kwargs["torch_dtype"] = getattr(torch, dtype)
+                self._processor = AutoProcessor.from_pretrained(self.model_name)
+                self._model = MusicgenForConditionalGeneration.from_pretrained(self.model_name, **load_kwargs)
+                self._model.eval()
+                self._apply_profile()
+            except Exception as e:
+                self._model = None
+                self._processor = None
+                self.ready.set_exception(e)
+                return
+            print(f"MusicGen model ready ({time.time() - started:.1f}s, profile: {self.profile})")
+            self.ready.set_result(self)
+
+    def unload(self):
+        """
+        Frees the model so a long-running process can give the memory back between sessions.
+        The next generation loads it again. Cached prompt embeddings are kept.
+        """
+        with self._lock:
+            if not self.ready.done():
+                return
+            self._model = None
+            self._processor = None
+            self._text_encoder_freed = False
+            self.ready = Future()
+        release_memory()
+        print("MusicGen model unloaded")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.unload()
+
+    def cache_prompts(self, emotion_lists):
+        """Computes and keeps the text-encoder embeddings of these emotion lists' prompts."""
+        prompts = [self.get_prompt(emotions) for emotions in emotion_lists]
+        self._encode_prompts([prompt for prompt in dict.fromkeys(prompts) if prompt not in self._prompt_embeddings])
+
+    def free_text_encoder(self):
+        """
+        Drops the text encoder's weights (a T5 encoder, ~1/5 of musicgen-small) once the prompts are cached.
+        Only in low_memory mode, where generation uses the cached embeddings. A prompt that isn't cached
+        later reloads the whole model.
+        """
+        if not self.low_memory:
+            raise RuntimeError("free_text_encoder() needs low_memory mode")
+        import torch
+        with self._lock:
+            text_encoder = self.model.text_encoder
+            # generate still reads the encoder's config, so leave an empty module carrying it
+            placeholder = torch.nn.Module()
+            placeholder.config = text_encoder.config
+            placeholder.main_input_name = text_encoder.main_input_name
+            self.model.text_encoder = placeholder
+            self._text_encoder_freed = True
+            del text_encoder
+        release_memory()
+        print(f"Text encoder freed ({len(self._prompt_embeddings)} prompts cached)")
+
+    def _encode_prompts(self, prompts):
+        if not prompts:
+            return
+        import torch
+        with self._lock:
+            if self._text_encoder_freed:
+                print("Prompt not cached and text encoder freed, reloading the model...")
+                self.unload()
+            inputs = self.processor(text=prompts, padding=True, return_tensors="pt")
+            with torch.inference_mode():
+                hidden = self.model.text_encoder(**inputs).last_hidden_state
+        # Store each prompt without its padding
+        for prompt, states, mask in zip(prompts, hidden, inputs["attention_mask"]):
+            self._prompt_embeddings[prompt] = states[: int(mask.sum())].clone()
+
+    def _prompt_inputs(self, prompts):
+        """generate() kwargs for a batch of prompts."""
+        if not self.low_memory:
+            return self.processor(text=prompts, padding=True, return_tensors="pt")
+
+        import torch
+        from transformers.modeling_outputs import BaseModelOutput
+        self._encode_prompts([prompt for prompt in dict.fromkeys(prompts) if prompt not in self._prompt_embeddings])
+        states = [self._prompt_embeddings[prompt] for prompt in prompts]
+        length = max(len(s) for s in states)
+        hidden = states[0].new_zeros((len(states), length, states[0].shape[-1]))
+        attention_mask = torch.zeros((len(states), length), dtype=torch.long)
+        for i, s in enumerate(states):
+            hidden[i, : len(s)] = s
+            attention_mask[i, : len(s)] = 1
+
+        guidance_scale = self.model.generation_config.guidance_scale
+        if guidance_scale is not None and guidance_scale > 1:
+            # Classifier-free guidance: the unconditional half gets a null (all-zero) prompt,
+            # as generate does when it runs the text encoder itself
+            hidden = torch.cat([hidden, torch.zeros_like(hidden)])
+            attention_mask = torch.cat([attention_mask, torch.zeros_like(attention_mask)])
+        return {
+            # Only tells generate the batch size; the text encoder is skipped
+            "input_ids": torch.zeros((len(states), 1), dtype=torch.long),
+            "attention_mask": attention_mask,
+            "encoder_outputs": BaseModelOutput(last_hidden_state=hidden),
+        }
+
+    def _apply_threads(self):
+        """Sets torch's thread counts. Runs before the model loads: inter-op threads can't change after parallel work."""
+        import torch
+        settings = INFERENCE_PROFILES[self.profile]
+
+        threads = os.environ.get("BRAINWAVE_THREADS") or settings["threads"]
+        if threads:
+            torch.set_num_threads(int(threads))
+        interop_threads = os.environ.get("BRAINWAVE_INTEROP_THREADS") or settings["interop_threads"]
+        if interop_threads and torch.get_num_interop_threads() != int(interop_threads):
+            try:
+                torch.set_num_interop_threads(int(interop_threads))
+            except RuntimeError:
+                # Can only be set once per process, before any parallel work
+                print("Could not set inter-op threads (already set or parallel work already started)")
+
+    def _apply_profile(self):
+        import torch
+        settings = INFERENCE_PROFILES[self.profile]
+
+        if settings["quantize"]:
+            from torch.ao.quantization import quantize_dynamic
+            quantize_dynamic(self._model.decoder, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+        if settings["compile"]:
+            # Sequence length grows every step, so compile for dynamic shapes to avoid recompiling
+            self._model.decoder.forward = torch.compile(self._model.decoder.forward, dynamic=True)
+
+    def _generate(self, inputs, tokens, prompt_samples=0, **kwargs):
+        """
+        model.generate under inference_mode, reporting the real-time factor (generation time / audio time).
+        prompt_samples: length of the re-decoded audio prompt the output starts with (not counted as generated).
+        """
+        import torch
+        started = time.time()
+        with torch.inference_mode():
+            audio_values = self.model.generate(**inputs, max_new_tokens=tokens, **kwargs)
+        elapsed = time.time() - started
+        metrics.observe(STAGE_METRIC, elapsed, stage="generate")
+        audio_seconds = (audio_values.shape[-1] - prompt_samples) / self.model.config.audio_encoder.sampling_rate
+        self.last_rtf = elapsed / audio_seconds if audio_seconds > 0 else None
+        if self.last_rtf is not None:
+            metrics.set("brainwave_generation_rtf", self.last_rtf, profile=self.profile)
+            print(f"Generated {len(audio_values)} x {audio_seconds:.1f}s in {elapsed:.1f}s (RTF {self.last_rtf:.2f}, profile: {self.profile})")
+        return audio_values
+
+    @property
+    def model(self):
+        """The MusicGen model (waits for a background load to finish, reloads after unload())."""
+        self._load()
+        self.ready.result()
+        return self._model
+
+    @property
+    def processor(self):
+        self._load()
+        self.ready.result()
+        return self._processor
         
     def get_prompt(self, emotions):
         # make a prompt to generate music based on the emotion detected by EEG
@@ -139,33 +991,187 @@ class MusicGenerator:
         final_prompt = f"A high quality music track. {', '.join(prompt_parts)}"
         return final_prompt
 
-    def generate_music(self, emotions, duration=10, filename="output_music.wav"):
+    def generate_music(self, emotions, duration=10, filename="output_music.wav", seed=None):
         """Generates a music file based on a list of emotions."""
+        self.generate_batch([emotions], duration=duration, filenames=[filename], seed=seed)
+
+    def generate_music_stream(self, emotions, duration=10, filename="output_music.wav", chunk_seconds=2.0, callback=None, seed=None):
+        """
+        Like generate_music, but playback can start before the clip is finished.
+        Tokens are decoded to audio every chunk_seconds; each chunk is appended to filename
+        (a valid, growing WAV) and passed to callback(chunk, sampling_rate), chunk shaped (samples, channels).
+        The file gets the output format's sample format and downmix; resampling and loudness need the
+        whole clip, so they only apply to generate_music / generate_batch.
+        """
         prompt = self.get_prompt(emotions)
-        print(f"Generating music with prompt: '{prompt}'")
-        
-        inputs = self.processor(
-            text=[prompt],
-            padding=True,
-            return_tensors="pt",
-        )
-        
-        # Calculate max_new_tokens
+        sampling_rate = self.model.config.audio_encoder.sampling_rate
+        # What a streamed file actually gets, so it doesn't share cache entries with whole clips
+        fmt = self.output_format._replace(sampling_rate=None, loudness=None)
+
+        if self.cache is not None:
+            key = self.cache.make_key(prompt, duration, self.model_name, self.generation_params(seed, fmt))
+            if self.cache.get(key, filename):
+                print(f"Cache hit for prompt: '{prompt}' -> {filename}")
+                if callback is not None:
+                    callback(*read_wav(filename))
+                return filename
+
+        print(f"Streaming music with prompt: '{prompt}'")
+        with metrics.timer(STAGE_METRIC, stage="tokenize"):
+            inputs = self._prompt_inputs([prompt])
+
         # MusicGen generates at 50 Hz frame rate
         tokens = int(duration * 50)
+        play_steps = max(1, int(chunk_seconds * 50))
+
+        import torch
+        from transformers import LogitsProcessorList
+
+        if seed is not None:
+            torch.manual_seed(seed)
+
+        started = time.time()
+        first_audio = []
+        channels = output_channels(fmt, self.model.config.decoder.audio_channels)
+        with WavStreamWriter(filename, sampling_rate, channels, fmt.sample_format, fmt.dither) as writer:
+            def on_audio(chunk):
+                if not first_audio:
+                    first_audio.append(time.time() - started)
+                    metrics.observe(STAGE_METRIC, first_audio[0], stage="first_audio")
+                    print(f"First audio after {first_audio[0]:.2f}s")
+                # (channels, samples) -> (samples, channels)
+                chunk = chunk.T
+                writer.write(chunk)
+                if callback is not None:
+                    callback(chunk, sampling_rate)
+            
+            streamer = AudioChunkStreamer(self.model, on_audio, play_steps=play_steps)
+            audio_values = self._generate(inputs, tokens, logits_processor=LogitsProcessorList([streamer]))
+            streamer.finish(audio_values[0])
+
+        print(f"Generated music saved to {filename} ({time.time() - started:.2f}s)")
+        if self.cache is not None:
+            self.cache.put(key, filename)
+        return filename
+
+    def generate_continuation(self, emotions, duration=10, audio_prompt=None, seed=None, stopping_criteria=None):
+        """
+        Generates duration seconds of music that continue audio_prompt (float, (channels, samples) at the
+        model's sampling rate, e.g. the end of the previous clip), using MusicGen's audio-prompt input.
+        audio_prompt is cut to whole codec frames from its end. Nothing is cached or written.
+        Returns (audio, prompt_samples): audio is (channels, samples) float32 and starts with the prompt
+        as re-decoded by the model (prompt_samples long, 0 without a prompt), then the new music.
+        stopping_criteria is passed to generate (e.g. to abandon the clip early).
+        """
+        prompt = self.get_prompt(emotions)
+        config = self.model.config.audio_encoder
+        print(f"Continuing music with prompt: '{prompt}'")
+        with metrics.timer(STAGE_METRIC, stage="tokenize"):
+            inputs = dict(self._prompt_inputs([prompt]))
+
+        prompt_samples = 0
+        if audio_prompt is not None:
+            frame = config.sampling_rate // config.frame_rate
+            prompt_samples = audio_prompt.shape[-1] // frame * frame
+        if prompt_samples:
+            audio_prompt = audio_prompt[:, audio_prompt.shape[-1] - prompt_samples:]
+            # The feature extractor takes (samples,) for mono and (2, samples) for stereo models
+            raw_audio = audio_prompt[0] if self.model.config.decoder.audio_channels == 1 else audio_prompt
+            features = self.processor.feature_extractor(raw_audio, sampling_rate=config.sampling_rate, return_tensors="pt")
+            dtype = next(self.model.audio_encoder.parameters()).dtype
+            inputs["input_values"] = features["input_values"].to(dtype)
+            inputs["padding_mask"] = features["padding_mask"]
+
+        if seed is not None:
+            import torch
+            torch.manual_seed(seed)
+        # MusicGen generates at 50 Hz frame rate
+        audio_values = self._generate(inputs, int(duration * 50), prompt_samples, stopping_criteria=stopping_criteria)
+        metrics.inc("brainwave_clips_generated_total")
+        return audio_values[0].cpu().float().numpy(), prompt_samples
+
+    def generation_params(self, seed=None, output_format=None):
+        """The generation and output settings that affect the file (part of the cache key)."""
+        config = self.model.generation_config
+        params = {
+            name: getattr(config, name, None)
+            for name in ("do_sample", "guidance_scale", "top_k", "top_p", "temperature")
+        }
+        params["seed"] = seed
+        if INFERENCE_PROFILES[self.profile]["quantize"] or INFERENCE_PROFILES[self.profile]["dtype"]:
+            # int8 / bf16 weights change the audio
+            params["profile"] = self.profile
+        output_format = output_format or self.output_format
+        if output_format != DEFAULT_FORMAT:
+            params["audio"] = str(output_format)
+        return params
+
+    def generate_batch(self, emotion_lists, duration=10, filenames=None, batch_size=8, seed=None):
+        """
+        Generates one music file per emotion list.
+        Prompts are sent to the model together as padded batches of up to batch_size,
+        which is much cheaper per clip than one generate call each.
+        With a cache, clips already rendered are copied from it and only the misses are generated.
+        """
+        if filenames is None:
+            filenames = [f"output_music_{i+1}.wav" for i in range(len(emotion_lists))]
+        if len(filenames) != len(emotion_lists):
+            raise ValueError("Need one filename per emotion list")
         
-        audio_values = self.model.generate(**inputs, max_new_tokens=tokens)
+        with metrics.timer(STAGE_METRIC, stage="prompt"):
+            prompts = [self.get_prompt(emotions) for emotions in emotion_lists]
+
+        # Waits for a background load (the cache key needs the model's generation config too)
+        with metrics.timer(STAGE_METRIC, stage="wait_model"):
+            self.model
         
-        # audio_values is (batch, channels, samples)
-        # We take the first one
-        audio_data = audio_values[0].cpu().numpy()
+        cache_keys = {}
+        if self.cache is not None:
+            params = self.generation_params(seed)
+            misses = []
+            for prompt, filename in zip(prompts, filenames):
+                key = self.cache.make_key(prompt, duration, self.model_name, params)
+                if self.cache.get(key, filename):
+                    print(f"Cache hit for prompt: '{prompt}' -> {filename}")
+                else:
+                    cache_keys[filename] = key
+                    misses.append((prompt, filename))
+            if not misses:
+                return
+            prompts = [prompt for prompt, _ in misses]
+            filenames = [filename for _, filename in misses]
         
-        sampling_rate = self.model.config.audio_encoder.sampling_rate
+        if seed is not None:
+            import torch
+            torch.manual_seed(seed)
         
-        # Scipy expects (samples, channels)
-        # Current shape (channels, samples) -> Transpose
-        if audio_data.ndim > 1:
-            audio_data = audio_data.T
+        for start in range(0, len(prompts), batch_size):
+            batch_prompts = prompts[start:start + batch_size]
+            batch_filenames = filenames[start:start + batch_size]
+            for prompt in batch_prompts:
+                print(f"Generating music with prompt: '{prompt}'")
+            
+            with metrics.timer(STAGE_METRIC, stage="tokenize"):
+                inputs = self._prompt_inputs(batch_prompts)
             
-        wavfile.write(filename, sampling_rate, audio_data)
+            # Calculate max_new_tokens
+            # MusicGen generates at 50 Hz frame rate
+            tokens = int(duration * 50)
+            
+            audio_values = self._generate(inputs, tokens)
+            
+            # audio_values is (batch, channels, samples)
+            for audio, filename in zip(audio_values, batch_filenames):
+                with metrics.timer(STAGE_METRIC, stage="to_numpy"):
+                    audio_data = audio.cpu().float().numpy()
+                with metrics.timer(STAGE_METRIC, stage="write_wav"):
+                    self._write_wav(filename, audio_data)
+                metrics.inc("brainwave_clips_generated_total")
+                if filename in cache_keys:
+                    self.cache.put(cache_keys[filename], filename)
+
+    def _write_wav(self, filename, audio_data):
+        # audio_data is (channels, samples); converted and written in blocks (see audio_io.write_wav)
+        sampling_rate = self.model.config.audio_encoder.sampling_rate
+        write_wav(filename, audio_data, sampling_rate, self.output_format)
         print(f"Generated music saved to {filename}")
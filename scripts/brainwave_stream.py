@@ -1,125 +1,134 @@
 import asyncio
-import json
-import ssl
-import websockets
-from brainwave_core import EEGProcessor, MusicGenerator
+from brainwave_core import policy_emotion
+from audio_cache import AudioCache
+from generation_worker import GenerationWorker
+from generation_server import make_generator
+from hub import HubSessions, HubSupervisor, hub_url
+from metrics import monitor_event_loop
+from radio_library import RadioLibrary
+from target_channel import TargetChannel
 import time
 import os
 
 HUB_IP = "your_hub_ip"
 
+# Pending generation jobs; when full, the oldest waiting job is dropped ("block" / "drop_newest" also available)
+GENERATION_QUEUE_SIZE = 4
+GENERATION_QUEUE_POLICY = "drop_oldest"
+
+# "What emotion do you want this person to feel?" is answered on stdin without pausing the stream.
+# Without an answer within TARGET_TIMEOUT seconds (0: never ask), TARGET_POLICY picks it:
+# "dominant" (the session's most common emotion), "opposite" or "fixed:<Emotion>"
+TARGET_TIMEOUT = 30
+TARGET_POLICY = "dominant"
+
 async def main():
     print(f"Connecting to {HUB_IP}")
     
-    # Initialize Core Components
-    processor = EEGProcessor()
-
-    # Disable SSL certificate verification (for testing only)
-    ssl_context = ssl.create_default_context()
-    ssl_context.check_hostname = False
-    ssl_context.verify_mode = ssl.CERT_NONE
-    
     # Create radios folder if it doesn't exist
     os.makedirs("../radios", exist_ok=True)
     
-    # Initialize generator once (loads model)
-    print("Initializing MusicGen model...")
-    generator = MusicGenerator()
+    # Initialize generator once. The model loads in a background thread while we connect and
+    # classify frames; the generation worker waits for it before the first job.
+    # With $BRAINWAVE_SERVER set, a running generation_server.py is used instead of a local model.
+    generator = make_generator(cache=AudioCache(), background=True)
+    
+    # Pre-rendered clips (python radio_library.py) are used before falling back to generation
+    library = RadioLibrary()
+    
+    # Generation runs in a worker thread so the receive loop keeps up with the stream
+    worker = GenerationWorker(
+        generator,
+        max_queue=GENERATION_QUEUE_SIZE,
+        policy=GENERATION_QUEUE_POLICY,
+        # In low-memory mode the model is freed between sessions and reloaded for the next one
+        unload_when_idle=generator.low_memory,
+    ).start()
+    
+    # Event-loop lag and generation queue depth (only when $BRAINWAVE_METRICS is set)
+    monitor = asyncio.create_task(monitor_event_loop(queue_depth=lambda: worker.depth))
+    
+    # Target emotions are read on a separate thread; questions wait in their own tasks
+    targets = TargetChannel(timeout=TARGET_TIMEOUT).start()
+    pending = set()
     
-    # Track sessions
-    current_session_emotions = []  # Emotions in current session
-    previous_p_bad = None
-    session_count = 0
     filename_counts = {}
     
-    try:
-        # Disable ping/pong since music generation blocks the async loop
-        async with websockets.connect(
-            f"wss://{HUB_IP}", 
-            ssl=ssl_context,
-            open_timeout=60,
-            close_timeout=10,
-            ping_interval=None,  # Disable automatic pings
-            ping_timeout=None
-        ) as ws:
-            print("Connected to stream. Monitoring for person sessions...")
-            print("(A session starts when headphone is on)")
-            print("(A session ends when headphone is off)\n")
+    async def finish_session(number, unique_emotions, default):
+        try:
+            # Ask user for their desired emotion for this person
+            user_emotion = await targets.ask(f"Session {number}: what emotion do you want this person to feel?", default)
             
-            async for msg in ws:
-                try:
-                    eeg = json.loads(msg)
-                    
-                    # Get p_bad values (check both Left and Right)
-                    left_p_bad = eeg.get('Left__p_bad', 1)
-                    right_p_bad = eeg.get('Right__p_bad', 1)
-                    
-                    # Consider headphone "on" if either side is on (p_bad close to 0)
-                    # Using threshold because p_bad might not be exactly 0 or 1
-                    is_headphone_on = (left_p_bad < 0.5 or right_p_bad < 0.5)
-                    
-                    # Detect session start (headphone put on)
-                    if is_headphone_on and (previous_p_bad is None or not previous_p_bad):
-                        if previous_p_bad is not None:  # Not the first data point
-                            session_count += 1
-                            print(f"\n{'='*60}")
-                            print(f"🎧 SESSION {session_count} STARTED")
-                            print(f"{'='*60}")
-                        current_session_emotions = []
-                    
-                    # Detect session end (headphone taken off)
-                    elif not is_headphone_on and previous_p_bad:
-                        if current_session_emotions:
-                            print(f"\n{'='*60}")
-                            print(f"🎧 SESSION {session_count} ENDED")
-                            print(f"Total data points: {len(current_session_emotions)}")
-                            print(f"{'='*60}\n")
-                            
-                            # Get unique emotions from this session
-                            unique_emotions = list(set(current_session_emotions))
-                            print(f"Unique emotions experienced: {unique_emotions}")
-                            
-                            # Ask user for their desired emotion for this person
-                            user_emotion = input(f"What emotion do you want this person to feel?: ").strip().capitalize()
-                            
-                            # Create prompt with all unique emotions + user emotion
-                            all_emotions = unique_emotions + [user_emotion]
-                            
-                            # Create filename
-                            emotions_str = "_".join([e.lower() for e in unique_emotions])
-                            base_name = f"session{session_count}_{emotions_str}_{user_emotion.lower()}"
-                            
-                            # Handle duplicates
-                            if base_name in filename_counts:
-                                filename_counts[base_name] += 1
-                                filename = f"../radios/{base_name}_{filename_counts[base_name]}.wav"
-                            else:
-                                filename_counts[base_name] = 0
-                                filename = f"../radios/{base_name}.wav"
-                            
-                            print(f"\nGenerating music for {all_emotions}...")
-                            generator.generate_music(all_emotions, duration=20, filename=filename)
-                            print(f"✓ Saved: {filename}\n")
-                            
-                            current_session_emotions = []
-                    
-                    # Process data if headphone is on
-                    if is_headphone_on:
-                        valence, arousal = processor.extract_features(eeg)
-                        eeg_emotion = processor.determine_emotion(valence, arousal)
-                        current_session_emotions.append(eeg_emotion)
-                        
-                        print(f"[Session {session_count}, Point {len(current_session_emotions)}] {eeg_emotion} (V:{valence:.2f}, A:{arousal:.2f}, L_p_bad:{left_p_bad:.2f}, R_p_bad:{right_p_bad:.2f})")
-                    
-                    previous_p_bad = is_headphone_on
-                    
-                except Exception as e:
-                    print(f"Error processing message: {e}")
+            # Create prompt with all unique emotions + user emotion
+            all_emotions = unique_emotions + [user_emotion]
+            
+            # Create filename
+            emotions_str = "_".join([e.lower() for e in unique_emotions])
+            base_name = f"session{number}_{emotions_str}_{user_emotion.lower()}"
+            
+            # Handle duplicates
+            if base_name in filename_counts:
+                filename_counts[base_name] += 1
+                filename = f"../radios/{base_name}_{filename_counts[base_name]}.wav"
+            else:
+                filename_counts[base_name] = 0
+                filename = f"../radios/{base_name}.wav"
+            
+            if library.pick(all_emotions, 20, filename):
+                print(f"✓ Picked from library: {filename}\n")
+            else:
+                print(f"\nQueued music for {all_emotions} (jobs waiting: {worker.depth})")
+                await worker.submit(all_emotions, 20, filename)
+        except Exception as e:
+            print(f"Error finishing session {number}: {e}")
+    
+    def on_start(hub, number):
+        print(f"\n{'='*60}")
+        print(f"🎧 SESSION {number} STARTED")
+        print(f"{'='*60}")
+    
+    def on_end(hub, number, session_emotions):
+        print(f"\n{'='*60}")
+        print(f"🎧 SESSION {number} ENDED")
+        print(f"Total data points: {session_emotions.points}")
+        print(f"{'='*60}\n")
+        
+        # Get unique emotions from this session
+        unique_emotions = session_emotions.unique_emotions()
+        print(f"Unique emotions experienced: {unique_emotions}")
+        
+        # The question and generation run in the background: frames keep being processed meanwhile
+        task = asyncio.create_task(
+            finish_session(number, unique_emotions, policy_emotion(TARGET_POLICY, session_emotions))
+        )
+        pending.add(task)
+        task.add_done_callback(pending.discard)
     
-    except asyncio.TimeoutError:
-        print("\nCheck server availability") #server is unstable or down
-    except Exception as e:
-        print(f"\nConnection error: {e}")
+    def on_emotion(hub, eeg, eeg_emotion, valence, arousal):
+        print(f"[Session {sessions.segmenter.current}, Point {sessions.session_emotions.points}] {eeg_emotion} (V:{valence:.2f}, A:{arousal:.2f}, L_p_bad:{eeg.left_p_bad:.2f}, R_p_bad:{eeg.right_p_bad:.2f})")
+    
+    # Sessions, classification and the current session's emotions (kept across reconnects);
+    # a gap longer than SESSION_GAP in the stream ends the session in progress
+    sessions = HubSessions(on_start=on_start, on_end=on_end, on_emotion=on_emotion)
+    
+    # Reconnects with backoff on its own; frames are buffered while the session logic catches up
+    supervisor = HubSupervisor(HUB_IP, hub_url(HUB_IP), sessions.handle, on_gap=sessions.on_gap)
+    print("Monitoring for person sessions...")
+    print("(A session starts when headphone is on)")
+    print("(A session ends when headphone is off)\n")
+    
+    try:
+        await supervisor.run()
+    finally:
+        monitor.cancel()
+        # Sessions still waiting for an answer get their default target
+        targets.close()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+        # Let the queued sessions finish generating before exiting
+        if worker.depth:
+            print(f"Finishing {worker.depth} queued generation jobs...")
+        await worker.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -2,52 +2,41 @@ import asyncio
 import json
 import ssl
 import websockets
-import csv
 import os
+from eeg_io import CSVAppendWriter, BinaryRecordingWriter, BINARY_SUFFIX
 from datetime import datetime
 import time
 
 HUB_IP = "your_hub_ip"
 
-def save_to_csv(data, filename):
+# Flush policy for the append-only CSV writer:
+# rows are pushed to the file every FLUSH_EVERY points, and fsync'd to disk if FSYNC is True
+FLUSH_EVERY = 10
+FSYNC = True
+
+# "csv" or "binary" (memory-mappable column files, see eeg_io.py)
+RECORDING_FORMAT = "csv"
+
+async def collect_with_retry(num_samples, writer, max_retries=5):
     """
-    Save collected data to CSV file.
-    Created this function to auto-save collected data to CSV file as the server is unstable.
+    Collect data with automatic retry on connection failure.
+    Each point is appended to the CSV as it arrives, so nothing has to be kept in memory
+    and a dropped connection loses at most the rows not yet flushed by the writer.
     """
-    if not data:
-        return
-    
-    # Get all unique keys
-    all_keys = set()
-    for row in data:
-        all_keys.update(row.keys())
-    
-    fieldnames = sorted(list(all_keys))
-    
-    # auto-save every 10 points
-    with open(filename, 'w', newline='') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(data)
-    
-    print(f"Auto-saved {len(data)} points to {filename}")
-
-async def collect_with_retry(num_samples, csv_filename, max_retries=5):
-    """Collect data with automatic retry on connection failure."""
     
     ssl_context = ssl.create_default_context()
     ssl_context.check_hostname = False
     ssl_context.verify_mode = ssl.CERT_NONE
     
-    collected_data = []
+    collected = 0
     retry_count = 0
     
-    while len(collected_data) < num_samples and retry_count < max_retries:
+    while collected < num_samples and retry_count < max_retries:
         try:
             print(f"\n{'='*60}")
             if retry_count > 0:
                 print(f"Retry attempt {retry_count}/{max_retries}")
-                print(f"Already collected: {len(collected_data)}/{num_samples}")
+                print(f"Already collected: {collected}/{num_samples}")
                 await asyncio.sleep(2)  # Wait before retry
             
             print(f"Connecting to {HUB_IP}...")
@@ -62,23 +51,20 @@ async def collect_with_retry(num_samples, csv_filename, max_retries=5):
                 ping_timeout=None
             ) as ws:
                 print(f"Connected! Collecting data...")
-                print(f"Target: {num_samples} points | Current: {len(collected_data)}\n")
+                print(f"Target: {num_samples} points | Current: {collected}\n")
                 
                 async for msg in ws:
                     try:
                         eeg = json.loads(msg)
-                        collected_data.append(eeg)
+                        writer.write(eeg)
+                        collected += 1
                         
                         # Show progress
                         left_p_bad = eeg.get('Left__p_bad', 1)
                         right_p_bad = eeg.get('Right__p_bad', 1)
-                        print(f"[{len(collected_data)}/{num_samples}] L_p_bad: {left_p_bad:.2f}, R_p_bad: {right_p_bad:.2f}")
-                        
-                        # Auto-save every 10 points
-                        if len(collected_data) % 10 == 0:
-                            save_to_csv(collected_data, csv_filename)
+                        print(f"[{collected}/{num_samples}] L_p_bad: {left_p_bad:.2f}, R_p_bad: {right_p_bad:.2f}")
                         
-                        if len(collected_data) >= num_samples:
+                        if collected >= num_samples:
                             print(f"\nCollected {num_samples} data points!")
                             break
                             
@@ -88,16 +74,14 @@ async def collect_with_retry(num_samples, csv_filename, max_retries=5):
         except asyncio.TimeoutError:
             retry_count += 1
             print(f"Connection timeout (attempt {retry_count}/{max_retries})")
-            if len(collected_data) > 0:
-                save_to_csv(collected_data, csv_filename)
+            writer.flush()
         
         except Exception as e:
             retry_count += 1
             print(f"Connection error: {e}")
-            if len(collected_data) > 0:
-                save_to_csv(collected_data, csv_filename)
+            writer.flush()
     
-    return collected_data
+    return collected
 
 async def main():
     print(f"Brainwave Radio - Data Collector")
@@ -110,28 +94,26 @@ async def main():
     
     # Create CSV filename with timestamp
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    csv_filename = f"../data/eeg_data_{timestamp}.csv"
+    if RECORDING_FORMAT == "binary":
+        csv_filename = f"../data/eeg_data_{timestamp}{BINARY_SUFFIX}"
+        writer_class = BinaryRecordingWriter
+    else:
+        csv_filename = f"../data/eeg_data_{timestamp}.csv"
+        writer_class = CSVAppendWriter
     
     print(f"Will save to: {csv_filename}")
-    print(f"Auto-save: Every 10 points")
+    print(f"Auto-save: Every {FLUSH_EVERY} points{' (fsync)' if FSYNC else ''}")
     print(f"Max retries: 5 attempts\n")
     
-    # Collect with retry
-    collected_data = await collect_with_retry(num_samples, csv_filename, max_retries=5)
+    # Collect with retry, appending each point as it arrives
+    with writer_class(csv_filename, flush_every=FLUSH_EVERY, fsync=FSYNC) as writer:
+        collected = await collect_with_retry(num_samples, writer, max_retries=5)
     
-    # Final save
-    if collected_data:
-        save_to_csv(collected_data, csv_filename)
-        
+    if collected:
         print(f" COLLECTION COMPLETE")
         print(f"File: {csv_filename}")
-        print(f"Total rows: {len(collected_data)}")
-        
-        # Get all unique keys
-        all_keys = set()
-        for data in collected_data:
-            all_keys.update(data.keys())
-        print(f"Total columns: {len(all_keys)}")
+        print(f"Total rows: {collected}")
+        print(f"Total columns: {len(writer.fieldnames)}")
         print(f"\nYou can now process this data offline with:")
         print(f"  python process_csv.py {csv_filename}")
     else:
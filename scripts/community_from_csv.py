@@ -1,6 +1,7 @@
-import csv
 import os
-from brainwave_core import EEGProcessor, MusicGenerator
+from audio_cache import AudioCache
+from generation_server import make_generator
+from process_csv import analyze_recording
 from collections import Counter
 
 def process_community_from_csv(csv_filename):
@@ -9,87 +10,46 @@ def process_community_from_csv(csv_filename):
     print(f"Brainwave Radio - Community Sound from CSV")
     print(f"Reading data from: {csv_filename}")
     
-    # Read CSV
-    data_points = []
-    with open(csv_filename, 'r') as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            # Convert string values back to float
-            converted_row = {}
-            for key, value in row.items():
-                try:
-                    converted_row[key] = float(value)
-                except (ValueError, TypeError):
-                    converted_row[key] = value
-            data_points.append(converted_row)
+    # The model loads in the background while the recording is read and segmented
+    # (or a running generation server is used, see generation_server.py)
+    generator = make_generator(cache=AudioCache(), background=True)
     
-    print(f"Loaded {len(data_points)} data points\n")
+    rows, sessions = analyze_recording(csv_filename)
+    print(f"Loaded {rows} data points\n")
     
-    # Initialize components
-    processor = EEGProcessor()
-    
-    # Track sessions (one per person)
-    sessions = []
-    current_session_emotions = []
-    previous_p_bad = None
-    session_count = 0
-    
-    # Process each data point to find sessions
+    # One session per person (found by analyze_recording)
     print("Detecting person sessions...\n")
-    for idx, eeg in enumerate(data_points):
-        # Get p_bad values
-        left_p_bad = eeg.get('Left__p_bad', 1)
-        right_p_bad = eeg.get('Right__p_bad', 1)
-        is_headphone_on = (left_p_bad < 0.5 or right_p_bad < 0.5)
-        
-        # Detect session start
-        if is_headphone_on and (previous_p_bad is None or not previous_p_bad):
-            if previous_p_bad is not None:
-                session_count += 1
-                print(f"Person {session_count} started session (row {idx})")
-            current_session_emotions = []
+    # Aggregate emotions across all people as sessions are found (each person counted once)
+    emotion_counts = Counter()
+    people = 0
+    for session, session_emotions in sessions:
+        if not session.complete:
+            continue
+        if session.number > 0:
+            print(f"Person {session.number} started session (row {session.start})")
         
-        # Detect session end
-        elif not is_headphone_on and previous_p_bad:
-            if current_session_emotions:
-                # Get unique emotions for this person
-                unique_emotions = list(set(current_session_emotions))
-                sessions.append(unique_emotions)
-                
-                print(f"Person {session_count} ended session (row {idx})")
-                print(f"Data points: {len(current_session_emotions)}")
-                print(f"Unique emotions: {unique_emotions}\n")
-                
-                current_session_emotions = []
+        # Get unique emotions for this person
+        unique_emotions = session_emotions.unique_emotions()
+        emotion_counts.update(unique_emotions)
+        people += 1
         
-        # Process data if headphone is on
-        if is_headphone_on:
-            valence, arousal = processor.extract_features(eeg)
-            eeg_emotion = processor.determine_emotion(valence, arousal)
-            current_session_emotions.append(eeg_emotion)
-        
-        previous_p_bad = is_headphone_on
+        print(f"Person {session.number} ended session (row {session.end})")
+        print(f"Data points: {session.end - session.start}")
+        print(f"Unique emotions: {unique_emotions}\n")
     
-    if not sessions:
+    if not people:
         print("No sessions found in CSV. Make sure the data has p_bad values.")
         return
     
-    # Aggregate emotions across all people (each person counted once)
-    all_emotions = []
-    for session_emotions in sessions:
-        all_emotions.extend(session_emotions)
-    
-    emotion_counts = Counter(all_emotions)
     most_common_emotion = emotion_counts.most_common(1)[0][0]
     
     print(f"Community Emotional State")
-    print(f"Total People: {len(sessions)}")
+    print(f"Total People: {people}")
     print(f"Most Common Emotion: {most_common_emotion}")
     print(f"Emotion Distribution: {dict(emotion_counts)}")
     
     # Generate "Community Sound"
     print(f"Generating 'Community Sound'...")
-    generator = MusicGenerator()
     
     # Create radios folder if it doesn't exist
     os.makedirs("../radios", exist_ok=True)
@@ -1,133 +1,105 @@
 import asyncio
-import json
-import ssl
-import websockets
-from brainwave_core import EEGProcessor, MusicGenerator
+from audio_cache import AudioCache
+from radio_library import RadioLibrary
+from generation_server import make_generator
+from hub import HubSessions, HubSupervisor, hub_url
+from metrics import monitor_event_loop
 from collections import Counter
 import os
 
-HUB_IP = "your_hub_ip"
+# One entry per headset hub (an IP, or a full ws:// / wss:// URL)
+HUB_IPS = ["your_hub_ip"]
 
-async def main():
-    print(f"Connecting to {HUB_IP}")
+async def collect_sessions(hubs, num_sessions):
+    """
+    Connects to every hub concurrently and returns (people, emotion_counts): the number of
+    completed sessions and a Counter of their unique emotions (each person counts once per emotion),
+    updated as each session ends. Stops at num_sessions, or when every hub gave up.
+    """
+    emotion_counts = Counter()
+    people = 0
+    enough = asyncio.Event()
     
-    # Initialize Core Components
-    processor = EEGProcessor()
+    def on_start(hub, number):
+        print(f"[{hub}] Person {number} started session")
     
-    # How many people/sessions to collect?
-    num_sessions = int(input("How many people/sessions to collect? (e.g., 5): ").strip())
+    def on_end(hub, number, session_emotions):
+        nonlocal people
+        # Get unique emotions for this person
+        unique_emotions = session_emotions.unique_emotions()
+        print(f"[{hub}] Person {number} ended session")
+        print(f"[{hub}] Data points: {session_emotions.points}")
+        print(f"[{hub}] Unique emotions: {unique_emotions}")
+        if enough.is_set():
+            return
+        people += 1
+        emotion_counts.update(unique_emotions)
+        print(f"Total people collected: {people}/{num_sessions}\n")
+        if people >= num_sessions:
+            print(f"Collected {num_sessions} people sessions!")
+            enough.set()
+    
+    # Each hub reconnects on its own and tracks its own sessions; sessions in progress survive short drops
+    tasks = []
+    for hub in hubs:
+        sessions = HubSessions(on_start=on_start, on_end=on_end)
+        tasks.append(asyncio.create_task(HubSupervisor(hub, hub_url(hub), sessions.handle, on_gap=sessions.on_gap).run()))
+    all_hubs_done = asyncio.gather(*tasks)
+    enough_task = asyncio.create_task(enough.wait())
+    try:
+        await asyncio.wait([all_hubs_done, enough_task], return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks + [enough_task]:
+            task.cancel()
+        await asyncio.gather(all_hubs_done, enough_task, return_exceptions=True)
+    return people, emotion_counts
 
-    # Disable SSL certificate verification (for testing only)
-    ssl_context = ssl.create_default_context()
-    ssl_context.check_hostname = False
-    ssl_context.verify_mode = ssl.CERT_NONE
+async def main(hubs=HUB_IPS):
+    print(f"Connecting to {len(hubs)} hub(s): {', '.join(hubs)}")
     
-    # Track sessions (one per person)
-    sessions = []  # List of sessions, each session has unique emotions
-    current_session_emotions = []
-    previous_p_bad = None
-    session_count = 0
+    # How many people/sessions to collect?
+    num_sessions = int(input("How many people/sessions to collect? (e.g., 5): ").strip())
+    print(f"Collecting {num_sessions} person sessions...")
+    print("(Each person = one session from headphone on to off)\n")
     
+    # Event-loop lag (only when $BRAINWAVE_METRICS is set)
+    monitor = asyncio.create_task(monitor_event_loop())
     try:
-        # Disable ping/pong since music generation blocks the async loop
-        async with websockets.connect(
-            f"wss://{HUB_IP}", 
-            ssl=ssl_context,
-            open_timeout=60,
-            close_timeout=10,
-            ping_interval=None,  # Disable automatic pings
-            ping_timeout=None
-        ) as ws:
-            print(f"Connected to stream. Collecting {num_sessions} person sessions...")
-            print("(Each person = one session from headphone on to off)\n")
-            
-            async for msg in ws:
-                try:
-                    eeg = json.loads(msg)
-                    
-                    # Get p_bad values
-                    left_p_bad = eeg.get('Left__p_bad', 1)
-                    right_p_bad = eeg.get('Right__p_bad', 1)
-                    is_headphone_on = (left_p_bad < 0.5 or right_p_bad < 0.5)
-                    
-                    # Detect session start
-                    if is_headphone_on and (previous_p_bad is None or not previous_p_bad):
-                        if previous_p_bad is not None:
-                            session_count += 1
-                            print(f"Person {session_count} started session")
-                        current_session_emotions = []
-                    
-                    # Detect session end
-                    elif not is_headphone_on and previous_p_bad:
-                        if current_session_emotions:
-                            # Get unique emotions for this person
-                            unique_emotions = list(set(current_session_emotions))
-                            sessions.append(unique_emotions)
-                            
-                            print(f"Person {session_count} ended session")
-                            print(f"Data points: {len(current_session_emotions)}")
-                            print(f"Unique emotions: {unique_emotions}")
-                            print(f"Total people collected: {len(sessions)}/{num_sessions}\n")
-                            
-                            current_session_emotions = []
-                            
-                            # Check if we have enough sessions
-                            if len(sessions) >= num_sessions:
-                                print(f"Collected {num_sessions} people sessions!")
-                                break
-                    
-                    # Process data if headphone is on
-                    if is_headphone_on:
-                        valence, arousal = processor.extract_features(eeg)
-                        eeg_emotion = processor.determine_emotion(valence, arousal)
-                        current_session_emotions.append(eeg_emotion)
-                    
-                    previous_p_bad = is_headphone_on
-                    
-                except Exception as e:
-                    print(f"Error processing message: {e}")
+        # Emotions are aggregated across all people as sessions end (each person counted once)
+        people, emotion_counts = await collect_sessions(hubs, num_sessions)
+    finally:
+        monitor.cancel()
     
-    except asyncio.TimeoutError:
-        print("Connection timeout. Please check the server.")
-        return
-    except Exception as e:
-        print(f"Connection error: {e}")
-        return
-    
-    if not sessions:
+    if not people:
         print("No sessions collected. Exiting.")
         return
     
-    # Aggregate emotions across all people (each person counted once)
-    all_emotions = []
-    for session_emotions in sessions:
-        # Each person contributes their most common emotion
-        # Or we can use all unique emotions from each person
-        all_emotions.extend(session_emotions)
-    
-    emotion_counts = Counter(all_emotions)
     most_common_emotion = emotion_counts.most_common(1)[0][0]
     
     print(f"Community Emotional State")
-    print(f"Total People: {len(sessions)}")
+    print(f"Total People: {people}")
     print(f"Most Common Emotion: {most_common_emotion}")
     print(f"Emotion Distribution: {dict(emotion_counts)}")
     
-    # Generate "Community Sound"
-    print(f"Generating 'Community Sound'...")
-    generator = MusicGenerator()
-    
     # Create radios folder if it doesn't exist
     os.makedirs("../radios", exist_ok=True)
     
     # Use only the community's most common emotion
     community_emotions = [most_common_emotion]
     
-    generator.generate_music(
-        emotions=community_emotions, 
-        duration=30,  # Longer for community sound
-        filename="../radios/community_sound.wav"
-    )
+    # A pre-rendered clip plays instantly; only generate if the library doesn't have one
+    if RadioLibrary().pick(community_emotions, 30, "../radios/community_sound.wav"):
+        print(f"Picked 'Community Sound' from the radio library")
+    else:
+        # Generate "Community Sound"
+        print(f"Generating 'Community Sound'...")
+        # The model is only needed for this one clip; free it as soon as it's done
+        with make_generator(cache=AudioCache()) as generator:
+            generator.generate_music(
+                emotions=community_emotions, 
+                duration=30,  # Longer for community sound
+                filename="../radios/community_sound.wav"
+            )
     
     print("Community Sound generated: radios/community_sound.wav")
 
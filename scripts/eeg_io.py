@@ -0,0 +1,412 @@
+import csv
+import json
+import math
+import os
+import numpy as np
+import pandas as pd
+
+# Schema of a hub frame: 13 band features per side + a timestamp
+BANDS = (
+    "total_power", "delta", "theta", "alpha", "beta", "beta_low", "beta_high",
+    "gamma", "a_ta", "b_tb", "b_ab", "mab_tmab", "p_bad",
+)
+SIDES = ("Left", "Right")
+KNOWN_COLUMNS = tuple(f"{side}__{band}" for side in SIDES for band in BANDS) + ("time",)
+
+# Rows per chunk when streaming a CSV (~20 MB of float64 for the 27 known columns)
+CHUNK_ROWS = 100_000
+
+def column_dtypes(band_dtype=np.float64):
+    """
+    Returns the dtype of every known column.
+    time (epoch seconds) and total_power (~1e10) always stay float64,
+    the normalized band features use band_dtype (pass np.float32 to halve memory).
+    """
+    dtypes = {}
+    for name in KNOWN_COLUMNS:
+        if name == "time" or name.endswith("__total_power"):
+            dtypes[name] = np.float64
+        else:
+            dtypes[name] = band_dtype
+    return dtypes
+
+def iter_csv_chunks(csv_filename, chunk_rows=CHUNK_ROWS, band_dtype=np.float64):
+    """
+    Streams a recording CSV as DataFrames of at most chunk_rows rows, so memory stays bounded.
+    Known Left__*/Right__*/time columns are parsed straight into typed arrays
+    (empty cells become NaN); unknown columns are kept with pandas' inferred dtype.
+    Rollover segments written by CSVAppendWriter are read in order after the main file.
+    """
+    dtypes = column_dtypes(band_dtype)
+    for segment in segment_paths(csv_filename):
+        reader = pd.read_csv(
+            segment,
+            dtype=dtypes,
+            chunksize=chunk_rows,
+            # Same values as Python's float(), so results match the old DictReader path
+            float_precision="round_trip",
+        )
+        with reader:
+            for chunk in reader:
+                yield chunk
+
+def load_csv(csv_filename, chunk_rows=CHUNK_ROWS, band_dtype=np.float64):
+    """Loads a whole recording CSV into one typed DataFrame."""
+    chunks = list(iter_csv_chunks(csv_filename, chunk_rows, band_dtype))
+    if not chunks:
+        return pd.DataFrame(columns=list(KNOWN_COLUMNS))
+    return pd.concat(chunks, ignore_index=True)
+
+def get_column(frame, name, default):
+    """Returns a column as a NumPy array, or an array filled with default if the column is missing."""
+    if name in frame:
+        return np.asarray(frame[name])
+    return np.full(len(frame), default, dtype=np.float64)
+
+def segment_paths(csv_filename):
+    """
+    Returns the CSV files that make up one recording, in order.
+    CSVAppendWriter rolls over to <name>.part2.csv, <name>.part3.csv, ... when the schema grows.
+    """
+    root, ext = os.path.splitext(csv_filename)
+    paths = [csv_filename]
+    part = 2
+    while os.path.exists(f"{root}.part{part}{ext}"):
+        paths.append(f"{root}.part{part}{ext}")
+        part += 1
+    return paths
+
+class CSVAppendWriter:
+    """
+    Appends rows to a recording CSV without ever rewriting what is already on disk.
+    If a row brings columns the header doesn't have, the current segment is closed and writing
+    continues in <name>.partN.csv with the extended (sorted) header. iter_csv_chunks reads all segments.
+    Rows are flushed every flush_every rows; with fsync=True each flush is also fsync'd to disk.
+    """
+    def __init__(self, csv_filename, flush_every=10, fsync=False):
+        self.csv_filename = csv_filename
+        self.flush_every = flush_every
+        self.fsync = fsync
+        self.fieldnames = None
+        self._field_set = frozenset()
+        self.rows_written = 0
+        self.segment = csv_filename
+        self._file = None
+        self._writer = None
+        self._unflushed = 0
+        
+        # Resume an existing recording: keep appending to its last segment
+        last_segment = segment_paths(csv_filename)[-1]
+        if os.path.exists(last_segment) and os.path.getsize(last_segment) > 0:
+            with open(last_segment, 'r', newline='') as csvfile:
+                self.fieldnames = next(csv.reader(csvfile))
+            self._field_set = frozenset(self.fieldnames)
+            self._open(last_segment, 'a')
+
+    def _open(self, path, mode):
+        self.segment = path
+        self._file = open(path, mode, newline='')
+        self._writer = csv.DictWriter(self._file, fieldnames=self.fieldnames)
+        if mode == 'w':
+            self._writer.writeheader()
+
+    def _roll_over(self, new_keys):
+        """Starts a new segment whose header includes the new columns."""
+        self._field_set = self._field_set | new_keys
+        self.fieldnames = sorted(self._field_set)
+        if self._file is None:
+            self._open(self.csv_filename, 'w')
+            return
+        self.flush(force=True)
+        self._file.close()
+        root, ext = os.path.splitext(self.csv_filename)
+        part = len(segment_paths(self.csv_filename)) + 1
+        self._open(f"{root}.part{part}{ext}", 'w')
+        print(f"New columns {sorted(new_keys)}: continuing in {self.segment}")
+
+    def write(self, row):
+        """Appends one row (a dict)."""
+        if not row.keys() <= self._field_set:
+            self._roll_over(row.keys() - self._field_set)
+        
+        self._writer.writerow(row)
+        self.rows_written += 1
+        self._unflushed += 1
+        if self._unflushed >= self.flush_every:
+            self.flush()
+
+    def flush(self, force=False):
+        """Pushes buffered rows to the OS (and to disk if fsync is enabled)."""
+        if self._file is None or (self._unflushed == 0 and not force):
+            return
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self._unflushed = 0
+
+    def close(self):
+        if self._file is not None:
+            self.flush(force=True)
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+# Binary columnar recordings: a directory with one raw little-endian file per column
+# plus schema.json, so columns can be memory-mapped without any text parsing.
+BINARY_FORMAT = "brainwave-eeg"
+BINARY_VERSION = 1
+BINARY_SUFFIX = ".eeg"
+SCHEMA_FILE = "schema.json"
+
+def is_binary_recording(path):
+    return os.path.isfile(os.path.join(path, SCHEMA_FILE))
+
+class BinaryRecordingWriter:
+    """
+    Appends rows to a binary recording (same interface as CSVAppendWriter).
+    Numeric columns are stored as float64 (int64 if every value is an int), so CSV conversion is lossless;
+    non-numeric columns go to a JSON-lines file. Columns that appear mid-run are back-filled with NaN.
+    schema.json (with the committed row count) is rewritten atomically on every flush.
+    """
+    def __init__(self, path, flush_every=10, fsync=False):
+        self.path = path
+        self.flush_every = flush_every
+        self.fsync = fsync
+        self.columns = []  # schema entries: {"name", "dtype", "file"}
+        self.rows_written = 0
+        self._index = {}
+        self._pending = {}
+        self._pending_rows = 0
+        os.makedirs(path, exist_ok=True)
+        
+        # Resume an existing recording
+        if is_binary_recording(path):
+            with open(os.path.join(path, SCHEMA_FILE)) as f:
+                schema = json.load(f)
+            for column in schema["columns"]:
+                self._index[column["name"]] = len(self.columns)
+                self.columns.append(column)
+            self.rows_written = schema["rows"]
+
+    @property
+    def fieldnames(self):
+        return [column["name"] for column in self.columns]
+
+    def _add_column(self, name, value):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            dtype = "str"
+        elif isinstance(value, int):
+            dtype = "<i8"
+        else:
+            dtype = "<f8"
+        ext = ".jsonl" if dtype == "str" else ".bin"
+        column = {"name": name, "dtype": dtype, "file": f"{len(self.columns):03d}{ext}"}
+        self._index[name] = len(self.columns)
+        self.columns.append(column)
+        # Earlier rows don't have this column
+        self._pending[name] = [None] * self.rows_written
+
+    def write(self, row):
+        """Appends one row (a dict)."""
+        for key, value in row.items():
+            if key not in self._index:
+                self._add_column(key, value)
+        for column in self.columns:
+            self._pending.setdefault(column["name"], []).append(row.get(column["name"]))
+        self._pending_rows += 1
+        self.rows_written += 1
+        if self._pending_rows >= self.flush_every:
+            self.flush()
+
+    def _encode(self, column, values):
+        dtype = column["dtype"]
+        if dtype == "<i8" and any(v is None or not isinstance(v, int) for v in values):
+            # A float or missing value in an int column: widen the file to float64 in place
+            self._widen(column)
+            dtype = column["dtype"]
+        if dtype == "str":
+            return "".join(json.dumps(v) + "\n" for v in values).encode()
+        return np.array([np.nan if v is None or v == "" else v for v in values], dtype=dtype).tobytes()
+
+    def _widen(self, column):
+        file_path = os.path.join(self.path, column["file"])
+        if os.path.exists(file_path):
+            existing = np.fromfile(file_path, dtype="<i8").astype("<f8")
+            existing.tofile(file_path)
+        column["dtype"] = "<f8"
+
+    def write_frame(self, frame):
+        """Appends a whole DataFrame chunk column by column, without going through per-row dicts."""
+        self.flush()
+        for name in frame.columns:
+            if name not in self._index:
+                # Pick the column type from the pandas dtype: int, float, or anything else as text
+                kind = frame[name].dtype.kind
+                self._add_column(name, 0 if kind in "iu" else 0.0 if kind == "f" else "")
+                self._write_column(self.columns[self._index[name]], self._pending.pop(name))
+        for column in self.columns:
+            if column["name"] in frame:
+                values = frame[column["name"]].to_numpy()
+            else:
+                values = np.full(len(frame), np.nan)
+            if column["dtype"] == "str":
+                data = self._encode(column, [_from_cell(v) for v in values.tolist()])
+            else:
+                if column["dtype"] == "<i8" and values.dtype.kind != "i":
+                    self._widen(column)
+                data = np.ascontiguousarray(values, dtype=column["dtype"]).tobytes()
+            self._append(column, data)
+        self.rows_written += len(frame)
+        self._write_schema()
+
+    def _append(self, column, data):
+        with open(os.path.join(self.path, column["file"]), "ab") as f:
+            f.write(data)
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _write_column(self, column, values):
+        if values:
+            self._append(column, self._encode(column, values))
+
+    def flush(self):
+        """Appends buffered rows to the column files and commits the new row count to schema.json."""
+        if self._pending_rows == 0 and not self._pending:
+            return
+        for column in self.columns:
+            self._write_column(column, self._pending.get(column["name"], []))
+        self._pending = {}
+        self._pending_rows = 0
+        self._write_schema()
+
+    def _write_schema(self):
+        schema = {
+            "format": BINARY_FORMAT,
+            "version": BINARY_VERSION,
+            "rows": self.rows_written,
+            "columns": self.columns,
+        }
+        tmp_path = os.path.join(self.path, SCHEMA_FILE + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(schema, f, indent=1)
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, os.path.join(self.path, SCHEMA_FILE))
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+class BinaryRecording:
+    """
+    Read-only view of a binary recording. Numeric columns are np.memmap arrays, so opening
+    is instant and only the pages that are touched get read. Supports len(), `in`, [] like a DataFrame.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, SCHEMA_FILE)) as f:
+            schema = json.load(f)
+        if schema.get("format") != BINARY_FORMAT or schema.get("version") != BINARY_VERSION:
+            raise ValueError(f"{path} is not a version {BINARY_VERSION} {BINARY_FORMAT} recording")
+        self.rows = schema["rows"]
+        self.schema = schema["columns"]
+        self.columns = [column["name"] for column in self.schema]
+        self._data = {}
+        for column in self.schema:
+            self._data[column["name"]] = self._open_column(column)
+
+    def _open_column(self, column):
+        file_path = os.path.join(self.path, column["file"])
+        if column["dtype"] == "str":
+            with open(file_path) as f:
+                values = [json.loads(line) for _, line in zip(range(self.rows), f)]
+            return np.array(values, dtype=object)
+        if self.rows == 0:
+            return np.empty(0, dtype=column["dtype"])
+        # Rows beyond the committed count (a crash mid-flush) are ignored
+        return np.memmap(file_path, dtype=column["dtype"], mode="r", shape=(self.rows,))
+
+    def __len__(self):
+        return self.rows
+
+    def __contains__(self, name):
+        return name in self._data
+
+    def __getitem__(self, name):
+        return self._data[name]
+
+    def iter_chunks(self, chunk_rows=CHUNK_ROWS):
+        """Yields DataFrames of at most chunk_rows rows, sliced straight from the mapped columns."""
+        for start in range(0, self.rows, chunk_rows):
+            yield pd.DataFrame({name: data[start:start + chunk_rows] for name, data in self._data.items()})
+
+def open_recording(path):
+    """Opens a recording: a memory-mapped BinaryRecording, or a DataFrame for CSV files."""
+    if is_binary_recording(path):
+        return BinaryRecording(path)
+    return load_csv(path)
+
+def iter_recording_chunks(path, chunk_rows=CHUNK_ROWS):
+    """Streams a CSV or binary recording as DataFrames of at most chunk_rows rows."""
+    if is_binary_recording(path):
+        return BinaryRecording(path).iter_chunks(chunk_rows)
+    return iter_csv_chunks(path, chunk_rows)
+
+def csv_to_binary(csv_filename, path, chunk_rows=CHUNK_ROWS):
+    """Converts a recording CSV (and its rollover segments) to the binary format."""
+    with BinaryRecordingWriter(path) as writer:
+        for chunk in iter_csv_chunks(csv_filename, chunk_rows):
+            writer.write_frame(chunk)
+    return path
+
+def binary_to_csv(path, csv_filename, chunk_rows=CHUNK_ROWS):
+    """Converts a binary recording back to CSV, formatted the way collect_data.py writes it."""
+    recording = BinaryRecording(path)
+    with open(csv_filename, "w", newline="") as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(recording.columns)
+        for start in range(0, len(recording), chunk_rows):
+            columns = [_to_cells(recording[name][start:start + chunk_rows]) for name in recording.columns]
+            writer.writerows(zip(*columns))
+    return csv_filename
+
+def _from_cell(value):
+    """Maps a pandas cell back to the Python value it came from (NaN = empty cell)."""
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+def _to_cells(values):
+    if values.dtype == object:
+        return ["" if v is None else v for v in values]
+    # tolist() gives Python floats/ints, whose str() is the shortest exact repr (as csv.DictWriter writes)
+    return ["" if v != v else v for v in values.tolist()]
+
+if __name__ == "__main__":
+    import sys
+    
+    if len(sys.argv) != 3:
+        print("Usage: python eeg_io.py <recording.csv> <recording.eeg>   (CSV -> binary)")
+        print("       python eeg_io.py <recording.eeg> <recording.csv>   (binary -> CSV)")
+        sys.exit(1)
+    
+    source, target = sys.argv[1], sys.argv[2]
+    if is_binary_recording(source):
+        binary_to_csv(source, target)
+    else:
+        csv_to_binary(source, target)
+    print(f"Converted {source} -> {target}")
@@ -0,0 +1,297 @@
+import argparse
+import base64
+import json
+import os
+import queue
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from brainwave_core import MusicGenerator, MODEL_NAME, INFERENCE_PROFILES
+from audio_cache import AudioCache
+
+DEFAULT_HOST = "127.0.0.1"  # local only: the server writes to paths its clients ask for
+DEFAULT_PORT = 8765
+BATCH_WINDOW = 0.05  # seconds to wait for more requests to batch with the first one
+MAX_BATCH = 8
+
+# Scripts use the server instead of loading their own model when this is set, e.g. http://127.0.0.1:8765
+SERVER_ENV = "BRAINWAVE_SERVER"
+
+class GenerationServer:
+    """
+    Keeps one MusicGenerator resident and serves generation requests over localhost HTTP.
+
+    POST /generate  {"jobs": [{"emotions": [...], "filename": "/abs/path.wav"}], "duration": 20,
+                     "seed": null, "return_audio": false}
+        -> {"files": [...]} or, with return_audio, {"audio": [base64 WAV, ...]}
+    GET /health     -> {"status": "loading" | "ready", "queued": n, "model": ..., "profile": ...}
+
+    Requests from all connections go through one queue. The generation thread takes the first
+    waiting job, waits batch_window for more, and renders jobs with the same duration and seed
+    together as one padded batch (MusicGenerator.generate_batch).
+    """
+    def __init__(self, generator, host=DEFAULT_HOST, port=DEFAULT_PORT, batch_window=BATCH_WINDOW, max_batch=MAX_BATCH):
+        self.generator = generator
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._tmp_dir = tempfile.mkdtemp(prefix="brainwave_server_")
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._run, name="musicgen-batcher", daemon=True)
+
+    @property
+    def address(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _reply(self, status, payload):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path != "/health":
+                    self._reply(404, {"error": "not found"})
+                    return
+                self._reply(200, server.health())
+
+            def do_POST(self):
+                if self.path != "/generate":
+                    self._reply(404, {"error": "not found"})
+                    return
+                try:
+                    request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                    self._reply(200, server.handle(request))
+                except (ValueError, KeyError, TypeError) as e:
+                    self._reply(400, {"error": f"bad request: {e}"})
+                except Exception as e:
+                    self._reply(500, {"error": str(e)})
+
+            def log_message(self, format, *args):
+                pass  # jobs are already logged by MusicGenerator
+
+        return Handler
+
+    def health(self):
+        ready = self.generator.ready.done()
+        return {
+            "status": "ready" if ready else "loading",
+            "queued": self._queue.qsize(),
+            "model": self.generator.model_name,
+            "profile": self.generator.profile,
+        }
+
+    def handle(self, request):
+        """Queues the request's jobs and waits for them. Runs on the HTTP connection's thread."""
+        duration = request.get("duration", 10)
+        seed = request.get("seed")
+        return_audio = request.get("return_audio", False)
+
+        # Check the whole request before queueing anything: a bad job must not leave the others rendering
+        if isinstance(duration, bool) or not isinstance(duration, (int, float)) or duration <= 0:
+            raise ValueError(f"duration must be a positive number, got {duration!r}")
+        jobs = []
+        for job in request["jobs"]:
+            emotions = job["emotions"]
+            if not isinstance(emotions, list) or not all(isinstance(emotion, str) for emotion in emotions):
+                raise TypeError(f"emotions must be a list of strings, got {emotions!r}")
+            if return_audio:
+                filename = os.path.join(self._tmp_dir, f"{uuid.uuid4().hex}.wav")
+            else:
+                filename = job["filename"]
+                if not isinstance(filename, str):
+                    raise TypeError(f"filename must be a string, got {filename!r}")
+            jobs.append((emotions, filename))
+
+        futures = []
+        for emotions, filename in jobs:
+            future = Future()
+            self._queue.put((emotions, duration, seed, filename, future))
+            futures.append(future)
+
+        files = [future.result() for future in futures]
+        if not return_audio:
+            return {"files": files}
+
+        audio = []
+        for filename in files:
+            with open(filename, "rb") as f:
+                audio.append(base64.b64encode(f.read()).decode("ascii"))
+            os.remove(filename)
+        return {"audio": audio}
+
+    def _next_batch(self):
+        """Blocks for one job, then collects whatever else arrives within batch_window."""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            # Only jobs with the same duration and seed can share a generate call
+            groups = {}
+            for job in batch:
+                groups.setdefault((job[1], job[2]), []).append(job)
+
+            for (duration, seed), jobs in groups.items():
+                if len(jobs) > 1:
+                    print(f"Batching {len(jobs)} requests ({duration}s)")
+                try:
+                    self._generate(jobs, duration, seed)
+                except Exception as e:
+                    if len(jobs) == 1:
+                        print(f"Generation failed: {e}")
+                        jobs[0][4].set_exception(e)
+                        continue
+                    # One bad job (e.g. an unwritable path) fails the whole batch: retry the jobs
+                    # one at a time so the error only reaches the client it belongs to
+                    print(f"Batch failed ({e}), retrying its {len(jobs)} jobs one at a time")
+                    for job in jobs:
+                        try:
+                            self._generate([job], duration, seed)
+                        except Exception as e:
+                            print(f"Generation failed: {e}")
+                            job[4].set_exception(e)
+                        else:
+                            job[4].set_result(job[3])
+                    continue
+                for _, _, _, filename, future in jobs:
+                    future.set_result(filename)
+
+    def _generate(self, jobs, duration, seed):
+        self.generator.generate_batch(
+            [emotions for emotions, _, _, _, _ in jobs],
+            duration=duration,
+            filenames=[filename for _, _, _, filename, _ in jobs],
+            batch_size=self.max_batch,
+            seed=seed,
+        )
+
+    def serve_forever(self):
+        self._thread.start()
+        print(f"Generation server listening on {self.address}")
+        try:
+            self._httpd.serve_forever()
+        finally:
+            self._httpd.server_close()
+
+    def shutdown(self):
+        self._httpd.shutdown()
+
+class GenerationClient:
+    """
+    Talks to a running GenerationServer with the same generate_music / generate_batch API as
+    MusicGenerator, so scripts don't have to load the model themselves.
+
+    By default the server writes the files itself (same machine, paths are made absolute);
+    with transfer_audio=True the WAV bytes come back in the response and are written here.
+    """
+    low_memory = False
+
+    def __init__(self, url=None, transfer_audio=False, timeout=3600):
+        self.url = (url or os.environ.get(SERVER_ENV) or f"http://{DEFAULT_HOST}:{DEFAULT_PORT}").rstrip("/")
+        self.transfer_audio = transfer_audio
+        self.timeout = timeout
+
+    def _request(self, path, payload=None):
+        data = json.dumps(payload).encode() if payload is not None else None
+        request = urllib.request.Request(
+            self.url + path, data=data, headers={"Content-Type": "application/json"}
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            raise RuntimeError(f"Generation server error: {json.loads(e.read()).get('error', e.reason)}") from None
+
+    def health(self):
+        return self._request("/health")
+
+    def generate_batch(self, emotion_lists, duration=10, filenames=None, batch_size=8, seed=None):
+        """Same as MusicGenerator.generate_batch; the server does the batching (batch_size is ignored)."""
+        if filenames is None:
+            filenames = [f"output_music_{i+1}.wav" for i in range(len(emotion_lists))]
+        if len(filenames) != len(emotion_lists):
+            raise ValueError("Need one filename per emotion list")
+
+        jobs = [
+            {"emotions": list(emotions), "filename": os.path.abspath(filename)}
+            for emotions, filename in zip(emotion_lists, filenames)
+        ]
+        response = self._request(
+            "/generate",
+            {"jobs": jobs, "duration": duration, "seed": seed, "return_audio": self.transfer_audio},
+        )
+        if self.transfer_audio:
+            for filename, audio in zip(filenames, response["audio"]):
+                with open(filename, "wb") as f:
+                    f.write(base64.b64decode(audio))
+        for filename in filenames:
+            print(f"Generated music saved to {filename}")
+
+    def generate_music(self, emotions, duration=10, filename="output_music.wav", seed=None):
+        """Generates a music file based on a list of emotions."""
+        self.generate_batch([emotions], duration=duration, filenames=[filename], seed=seed)
+        return filename
+
+    def unload(self):
+        pass  # the model lives in the server
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+def make_generator(cache=None, background=False):
+    """
+    A GenerationClient if $BRAINWAVE_SERVER is set, otherwise a local MusicGenerator.
+    (The server has its own cache, so `cache` only applies to the local generator.)
+    """
+    url = os.environ.get(SERVER_ENV)
+    if url:
+        print(f"Using generation server at {url}")
+        return GenerationClient(url)
+    return MusicGenerator(cache=cache, background=background)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Keep MusicGen loaded and serve generation requests on localhost.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--model", default=MODEL_NAME)
+    parser.add_argument("--profile", choices=list(INFERENCE_PROFILES), help="CPU inference profile (default: $BRAINWAVE_PROFILE)")
+    parser.add_argument("--batch-window", type=float, default=BATCH_WINDOW, help="seconds to wait for requests to batch together")
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH)
+    args = parser.parse_args()
+
+    # Load in the background so /health answers ("loading") right away
+    generator = MusicGenerator(args.model, cache=AudioCache(), background=True, profile=args.profile)
+    server = GenerationServer(
+        generator, host=args.host, port=args.port, batch_window=args.batch_window, max_batch=args.max_batch
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nStopping generation server")
@@ -0,0 +1,110 @@
+import asyncio
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from metrics import metrics
+
+GenerationJob = namedtuple("GenerationJob", ["emotions", "duration", "filename"])
+
+# What submit() does when the queue is full
+QUEUE_POLICIES = ("block", "drop_newest", "drop_oldest")
+
+class GenerationWorker:
+    """
+    Runs MusicGenerator.generate_music in a worker thread behind a bounded job queue,
+    so the websocket receive loop keeps reading and classifying frames while the model runs.
+
+    When the queue is full, policy decides:
+    - "block": submit() waits for space (backpressure on the caller)
+    - "drop_newest": the new job is rejected
+    - "drop_oldest": the oldest waiting job is dropped to make room
+
+    With unload_when_idle, the model is unloaded whenever the queue runs empty (it reloads for the next job),
+    so a long-running process only holds it while there's work.
+    """
+    def __init__(self, generator, max_queue=4, policy="drop_oldest", unload_when_idle=False):
+        if policy not in QUEUE_POLICIES:
+            raise ValueError(f"policy must be one of {QUEUE_POLICIES}")
+        self.generator = generator
+        self.max_queue = max_queue
+        self.policy = policy
+        self.unload_when_idle = unload_when_idle
+        self.completed = 0
+        self.failed = 0
+        self.dropped = 0
+        self._queue = None
+        self._task = None
+        self._executor = None
+
+    def start(self):
+        """Starts the worker on the running event loop."""
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="musicgen")
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    @property
+    def depth(self):
+        """Number of jobs waiting (not counting the one being generated)."""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def submit(self, emotions, duration, filename):
+        """Queues a generation job. Returns False if it was dropped."""
+        job = GenerationJob(emotions, duration, filename)
+        if self.policy == "block":
+            await self._queue.put(job)
+            return True
+
+        if self._queue.full():
+            if self.policy == "drop_newest":
+                self.dropped += 1
+                metrics.inc("brainwave_generation_jobs_total", result="dropped")
+                print(f"Generation queue full, dropped {filename}")
+                return False
+            oldest = self._queue.get_nowait()
+            self._queue.task_done()
+            self.dropped += 1
+            metrics.inc("brainwave_generation_jobs_total", result="dropped")
+            print(f"Generation queue full, dropped {oldest.filename}")
+        self._queue.put_nowait(job)
+        metrics.set("brainwave_generation_queue_depth", self._queue.qsize())
+        return True
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self._queue.get()
+            metrics.set("brainwave_generation_queue_depth", self._queue.qsize())
+            try:
+                with metrics.timer("brainwave_generation_job_seconds"):
+                    await loop.run_in_executor(
+                        self._executor,
+                        self.generator.generate_music,
+                        job.emotions,
+                        job.duration,
+                        job.filename,
+                    )
+                self.completed += 1
+                metrics.inc("brainwave_generation_jobs_total", result="completed")
+                print(f"✓ Saved: {job.filename}\n")
+            except Exception as e:
+                self.failed += 1
+                metrics.inc("brainwave_generation_jobs_total", result="failed")
+                print(f"Error generating {job.filename}: {e}")
+            finally:
+                if self.unload_when_idle and self._queue.empty():
+                    await loop.run_in_executor(self._executor, self.generator.unload)
+                self._queue.task_done()
+
+    async def close(self, wait=True):
+        """Stops the worker. With wait=True, finishes the queued jobs first."""
+        if self._task is None:
+            return
+        if wait:
+            await self._queue.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._executor.shutdown(wait=wait)
+        self._task = None
@@ -0,0 +1,224 @@
+import asyncio
+import inspect
+import random
+import ssl
+from collections import deque
+import websockets
+from brainwave_core import EEGFrame, EEGProcessor, EmotionAggregator, FrameError, SessionSegmenter, decode_frame
+from metrics import metrics
+
+# Reconnect / timeout handling for one hub connection
+BASE_DELAY = 1       # seconds before the first reconnect attempt, doubled after each failure...
+MAX_DELAY = 60       # ...up to this
+MAX_RETRIES = None   # consecutive failed attempts before giving up on a hub (None: never give up)
+IDLE_TIMEOUT = 30    # seconds without a frame before the connection is considered dead
+
+# Frames waiting to be processed; when full, the oldest are dropped
+BUFFER_SIZE = 2048
+# A jump in the frames' `time` larger than this is reported as a gap
+GAP_SECONDS = 2.0
+# A gap this long ends the session in progress (the headset was likely taken off meanwhile)
+SESSION_GAP = 30
+
+def insecure_ssl_context():
+    """The hubs use self-signed certificates: disable verification (for testing only)."""
+    ssl_context = ssl.create_default_context()
+    ssl_context.check_hostname = False
+    ssl_context.verify_mode = ssl.CERT_NONE
+    return ssl_context
+
+def hub_url(hub):
+    """"192.168.0.10" -> "wss://192.168.0.10"; full ws:// / wss:// URLs are kept as they are."""
+    return hub if "://" in hub else f"wss://{hub}"
+
+def backoff_delay(failures, base_delay=BASE_DELAY, max_delay=MAX_DELAY):
+    """Exponential backoff with jitter: a random delay in [d/2, d], d = base * 2^(failures-1) capped at max_delay."""
+    delay = min(max_delay, base_delay * 2 ** max(0, failures - 1))
+    return random.uniform(delay / 2, delay)
+
+class HubSupervisor:
+    """
+    Keeps one hub connection alive and feeds its frames, in order, to on_frame(name, eeg)
+    (a function or a coroutine function). Frames arrive as EEGFrame records; malformed
+    messages are dropped when they're received.
+
+    Receiving and processing are separate tasks joined by a bounded ring buffer: the receiver
+    reconnects on errors or after idle_timeout without frames (exponential backoff with jitter),
+    while the consumer keeps working through what's buffered. State kept by the callbacks
+    (sessions, aggregates) lives across reconnects.
+
+    The frames' `time` field is tracked: frames at or before the last processed time (replayed
+    after a reconnect) are skipped, and a jump of more than gap_seconds calls on_gap(name, seconds).
+    """
+    def __init__(self, name, url, on_frame, on_gap=None, buffer_size=BUFFER_SIZE, gap_seconds=GAP_SECONDS,
+                 base_delay=BASE_DELAY, max_delay=MAX_DELAY, max_retries=MAX_RETRIES, idle_timeout=IDLE_TIMEOUT):
+        self.name = name
+        self.url = url
+        self.on_frame = on_frame
+        self.on_gap = on_gap
+        self.gap_seconds = gap_seconds
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retries = max_retries
+        self.idle_timeout = idle_timeout
+        self.buffer = deque(maxlen=buffer_size)
+        self.last_time = None
+        self.connected = False
+        self.reconnects = 0
+        self.dropped = 0
+        self.skipped = 0
+        self._has_frames = asyncio.Event()
+        self._receiving = False
+
+    async def run(self):
+        """Runs until cancelled, or until the receiver gives up and the buffer is drained."""
+        self._receiving = True
+        receiver = asyncio.create_task(self._receive())
+        try:
+            await self._consume()
+        finally:
+            receiver.cancel()
+            await asyncio.gather(receiver, return_exceptions=True)
+
+    async def _receive(self):
+        kwargs = {"ssl": insecure_ssl_context()} if self.url.startswith("wss://") else {}
+        failures = 0
+        try:
+            while True:
+                try:
+                    async with websockets.connect(
+                        self.url,
+                        open_timeout=60,
+                        close_timeout=10,
+                        ping_interval=20,
+                        ping_timeout=60,
+                        **kwargs,
+                    ) as ws:
+                        print(f"[{self.name}] Connected")
+                        self.connected = True
+                        while True:
+                            msg = await asyncio.wait_for(ws.recv(), timeout=self.idle_timeout)
+                            self._push(msg)
+                            failures = 0  # only a connection that delivers data resets the backoff
+                except asyncio.TimeoutError:
+                    print(f"[{self.name}] No data for {self.idle_timeout}s")
+                except Exception as e:
+                    print(f"[{self.name}] Connection error: {e}")
+                self.connected = False
+
+                failures += 1
+                if self.max_retries is not None and failures > self.max_retries:
+                    print(f"[{self.name}] Giving up after {self.max_retries} retries")
+                    return
+                delay = backoff_delay(failures, self.base_delay, self.max_delay)
+                print(f"[{self.name}] Reconnecting in {delay:.1f}s ({len(self.buffer)} frames buffered)")
+                metrics.inc("brainwave_hub_reconnects_total", hub=self.name)
+                self.reconnects += 1
+                await asyncio.sleep(delay)
+        finally:
+            self._receiving = False
+            self._has_frames.set()  # wake the consumer so it can drain and stop
+
+    def _push(self, msg):
+        metrics.inc("brainwave_messages_total", hub=self.name)
+        try:
+            with metrics.timer("brainwave_message_seconds", stage="parse"):
+                eeg = decode_frame(msg)
+        except FrameError as e:
+            print(f"[{self.name}] Bad frame: {e}")
+            return
+        if len(self.buffer) == self.buffer.maxlen:
+            self.dropped += 1
+            metrics.inc("brainwave_hub_frames_dropped_total", hub=self.name)
+        self.buffer.append(eeg)
+        self._has_frames.set()
+
+    async def _consume(self):
+        processed = 0
+        while True:
+            if not self.buffer:
+                if not self._receiving:
+                    return
+                self._has_frames.clear()
+                await self._has_frames.wait()
+                continue
+
+            eeg = self.buffer.popleft()
+            frame_time = eeg.time
+            if frame_time is not None:
+                if self.last_time is not None:
+                    if frame_time <= self.last_time:
+                        self.skipped += 1  # already processed (replayed after a reconnect)
+                        continue
+                    gap = frame_time - self.last_time
+                    if gap > self.gap_seconds:
+                        print(f"[{self.name}] Gap of {gap:.1f}s in the stream")
+                        metrics.observe("brainwave_hub_gap_seconds", gap, hub=self.name)
+                        if self.on_gap is not None:
+                            result = self.on_gap(self.name, gap)
+                            if inspect.isawaitable(result):
+                                await result
+                self.last_time = frame_time
+
+            result = self.on_frame(self.name, eeg)
+            if inspect.isawaitable(result):
+                await result
+
+            # Let the receiver run between frames when working through a backlog
+            processed += 1
+            if processed % 100 == 0:
+                await asyncio.sleep(0)
+
+class HubSessions:
+    """
+    The frame -> emotion handling the live scripts share, as HubSupervisor callbacks (handle, on_gap)
+    for one hub's headset. Frames are split into person sessions (headphone on to off, see
+    SessionSegmenter); while the headphone is on each frame is classified and counted in
+    session_emotions, with band smoothing restarted for every person. Optional callbacks:
+      on_start(hub, number)                            a session started
+      on_emotion(hub, eeg, emotion, valence, arousal)  a frame was classified
+      on_end(hub, number, session_emotions)            a session ended (session_emotions is reset after)
+    A gap in the stream longer than SESSION_GAP ends the session in progress.
+    """
+    def __init__(self, processor=None, segmenter=None, on_start=None, on_end=None, on_emotion=None):
+        # One processor per hub: band smoothing keeps per-stream state
+        self.processor = processor or EEGProcessor()
+        self.segmenter = segmenter or SessionSegmenter()
+        self.session_emotions = EmotionAggregator()
+        self.on_start = on_start
+        self.on_end = on_end
+        self.on_emotion = on_emotion
+
+    def handle(self, hub, eeg):
+        try:
+            was_on = self.segmenter.on
+            event = self.segmenter.push(eeg.left_p_bad, eeg.right_p_bad)
+            if self.segmenter.on and not was_on:
+                self.processor.reset_smoothing()  # smooth over this person's frames only
+
+            if event and event.kind == "start":
+                if self.on_start is not None:
+                    self.on_start(hub, event.number)
+            elif event and event.kind == "end":
+                if self.on_end is not None:
+                    self.on_end(hub, event.number, self.session_emotions)
+
+            # Session ended or was too short to count: start collecting afresh
+            if event and event.kind != "start":
+                self.session_emotions.reset()
+
+            if self.segmenter.on:
+                with metrics.timer("brainwave_message_seconds", stage="classify"):
+                    valence, arousal = self.processor.extract_features(eeg)
+                    emotion = self.processor.determine_emotion(valence, arousal)
+                self.session_emotions.add(emotion, eeg.time)
+                if self.on_emotion is not None:
+                    self.on_emotion(hub, eeg, emotion, valence, arousal)
+        except Exception as e:
+            print(f"[{hub}] Error processing message: {e}")
+
+    def on_gap(self, hub, seconds):
+        # The headset was probably taken off while the link was down: close the session in progress
+        if seconds > SESSION_GAP and self.segmenter.on:
+            print(f"[{hub}] Stream was down for {seconds:.0f}s, ending the current session")
+            self.handle(hub, EEGFrame())  # no p_bad = headphone off
@@ -0,0 +1,200 @@
+import asyncio
+import bisect
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Where metrics go, from $BRAINWAVE_METRICS:
+#   (unset)              disabled: every call returns right away
+#   log                  one printed line per observation
+#   jsonl:<path>         one JSON object per observation, appended to <path>
+#   prometheus[:<port>]  text exposition on http://127.0.0.1:<port>/metrics (default port 9108)
+METRICS_ENV = "BRAINWAVE_METRICS"
+PROMETHEUS_PORT = 9108
+
+# Histogram buckets in seconds, from sub-millisecond message handling to minute-long generation
+BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 120, 300)
+
+class LogSink:
+    def record(self, kind, name, value, labels):
+        fields = [name] + [f"{k}={v}" for k, v in labels] + [f"{kind}={value:.6g}"]
+        print("[metrics] " + " ".join(fields))
+
+class JsonlSink:
+    def __init__(self, path):
+        self._file = open(path, "a", buffering=1)  # line buffered
+        self._lock = threading.Lock()
+
+    def record(self, kind, name, value, labels):
+        line = json.dumps({"ts": time.time(), "kind": kind, "name": name, "value": value, "labels": dict(labels)})
+        with self._lock:
+            self._file.write(line + "\n")
+
+class PrometheusSink:
+    """Serves the registry's aggregates; single observations aren't kept."""
+    def __init__(self, registry, port=PROMETHEUS_PORT, host="127.0.0.1"):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.exposition().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._httpd.daemon_threads = True
+        threading.Thread(target=self._httpd.serve_forever, name="metrics-http", daemon=True).start()
+        print(f"Metrics on http://{host}:{self._httpd.server_address[1]}/metrics")
+
+    def record(self, kind, name, value, labels):
+        pass
+
+class _Timer:
+    __slots__ = ("registry", "name", "labels", "started")
+
+    def __init__(self, registry, name, labels):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.registry.observe(self.name, time.perf_counter() - self.started, **self.labels)
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+_NULL_TIMER = _NullTimer()
+
+class Metrics:
+    """
+    Counters, gauges and histograms, keyed by name + labels.
+    When no sink is configured, inc/set/observe return immediately and timer() returns a shared
+    no-op context manager, so instrumented code costs about one attribute check per call.
+    """
+    def __init__(self, sink=None):
+        self.sink = sink
+        self.enabled = sink is not None
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}  # key -> [bucket counts..., sum, count]
+
+    def configure(self, spec):
+        """Sets the sink from a $BRAINWAVE_METRICS style string ("" disables)."""
+        kind, _, arg = (spec or "").partition(":")
+        if not kind:
+            self.sink = None
+        elif kind == "log":
+            self.sink = LogSink()
+        elif kind == "jsonl":
+            self.sink = JsonlSink(arg or "metrics.jsonl")
+        elif kind == "prometheus":
+            self.sink = PrometheusSink(self, port=int(arg) if arg else PROMETHEUS_PORT)
+        else:
+            raise ValueError(f"Unknown metrics sink {spec!r} (expected log, jsonl:<path> or prometheus[:<port>])")
+        self.enabled = self.sink is not None
+        return self
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+        self.sink.record("count", name, value, key[1])
+
+    def set(self, name, value, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._gauges[key] = value
+        self.sink.record("gauge", name, value, key[1])
+
+    def observe(self, name, value, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * (len(BUCKETS) + 3)
+            histogram[bisect.bisect_left(BUCKETS, value)] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+        self.sink.record("seconds", name, value, key[1])
+
+    def timer(self, name, **labels):
+        """with metrics.timer("stage_seconds", stage="x"): ... observes the block's duration."""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name, labels)
+
+    def exposition(self):
+        """The aggregates in Prometheus text format."""
+        def fmt_labels(labels, extra=()):
+            pairs = [f'{k}="{v}"' for k, v in tuple(labels) + tuple(extra)]
+            return "{" + ",".join(pairs) + "}" if pairs else ""
+
+        lines = []
+        declared = set()
+
+        def declare(name, kind):
+            if name not in declared:
+                declared.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            for (name, labels), value in sorted(self._counters.items()):
+                declare(name, "counter")
+                lines.append(f"{name}{fmt_labels(labels)} {value}")
+            for (name, labels), value in sorted(self._gauges.items()):
+                declare(name, "gauge")
+                lines.append(f"{name}{fmt_labels(labels)} {value}")
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                declare(name, "histogram")
+                cumulative = 0
+                for bound, count in zip(BUCKETS + (float("inf"),), histogram[:-2]):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{name}_bucket{fmt_labels(labels, [('le', le)])} {cumulative}")
+                lines.append(f"{name}_sum{fmt_labels(labels)} {histogram[-2]}")
+                lines.append(f"{name}_count{fmt_labels(labels)} {histogram[-1]}")
+        return "\n".join(lines) + "\n"
+
+async def monitor_event_loop(interval=1.0, queue_depth=None):
+    """
+    Runs as a task next to a receive loop. Records how late the loop wakes up from a sleep
+    (event-loop lag: time the loop spent blocked) and, if given, queue_depth() as a gauge.
+    """
+    if not metrics.enabled:
+        return
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        metrics.observe("brainwave_event_loop_lag_seconds", max(0.0, loop.time() - started - interval))
+        if queue_depth is not None:
+            metrics.set("brainwave_generation_queue_depth", queue_depth())
+
+# The process-wide registry every module reports to
+metrics = Metrics().configure(os.environ.get(METRICS_ENV))
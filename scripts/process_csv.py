@@ -1,111 +1,86 @@
-import csv
 import os
-from brainwave_core import EEGProcessor, MusicGenerator
+import numpy as np
+from brainwave_core import EEGProcessor, EmotionAggregator, SessionSegmenter
+from audio_cache import AudioCache
+from eeg_io import iter_recording_chunks, get_column
+from generation_server import make_generator
+
+# Sessions are generated together, this many per model call
+GENERATION_BATCH_SIZE = 8
+
+def analyze_recording(csv_filename, processor=None, segmenter=None):
+    """
+    Reads, classifies and segments one recording (CSV or binary).
+    Returns (rows, sessions): sessions is a list of (Session, EmotionAggregator) for every session
+    to make music for: the complete ones, plus one cut off by the end of the file (except session 0:
+    if the headphone never came off there is nothing to split).
+    """
+    processor = processor or EEGProcessor()
+    segmenter = segmenter or SessionSegmenter()
+    
+    # Stream the recording (CSV or memory-mapped binary) in typed chunks so memory stays bounded.
+    # Only the headphone state and emotion code of each row are kept (2 bytes per row).
+    headphone_on = []
+    emotion_codes = []
+    was_on = False
+    for chunk in iter_recording_chunks(csv_filename):
+        on = segmenter.headphone_on_batch(
+            get_column(chunk, 'Left__p_bad', 1),
+            get_column(chunk, 'Right__p_bad', 1),
+        )
+        headphone_on.append(on)
+        # Classify every row of the chunk in one vectorized pass
+        # (band smoothing, if enabled, restarts whenever the headphone is put on, as when streaming)
+        restart = on & ~np.concatenate(([was_on], on[:-1]))
+        _, _, codes = processor.classify_batch(chunk, restart=restart)
+        emotion_codes.append(codes)
+        if len(on):
+            was_on = bool(on[-1])
+    
+    headphone_on = np.concatenate(headphone_on) if headphone_on else np.zeros(0, dtype=bool)
+    emotion_codes = np.concatenate(emotion_codes) if emotion_codes else np.zeros(0, dtype=np.int8)
+    
+    # Find every person session in one vectorized pass
+    sessions = []
+    for session in segmenter.find_sessions(headphone_on):
+        if not session.complete and session.number == 0:
+            continue
+        session_emotions = EmotionAggregator()
+        session_emotions.add_codes(emotion_codes[session.start:session.end])
+        sessions.append((session, session_emotions))
+    return len(emotion_codes), sessions
 
 def process_from_csv(csv_filename):
     """Process EEG data from CSV file and generate music per person session."""
     
     print(f"Reading data from: {csv_filename}")
     
-    # Read CSV
-    data_points = []
-    with open(csv_filename, 'r') as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            # Convert string values back to float
-            converted_row = {}
-            for key, value in row.items():
-                try:
-                    converted_row[key] = float(value)
-                except (ValueError, TypeError):
-                    converted_row[key] = value
-            data_points.append(converted_row)
-    
-    print(f"Loaded {len(data_points)} data points\n")
-    
-    # Initialize components
-    processor = EEGProcessor()
-    generator = MusicGenerator()
+    # The model loads in the background while the recording is read and segmented
+    # (or a running generation server is used, see generation_server.py)
+    generator = make_generator(cache=AudioCache(), background=True)
     
     # Create radios folder
     os.makedirs("../radios", exist_ok=True)
     
-    # Track sessions
-    sessions = []
-    current_session_emotions = []
-    previous_p_bad = None
-    session_count = 0
+    rows, sessions = analyze_recording(csv_filename)
+    print(f"Loaded {rows} data points\n")
     filename_counts = {}
+    jobs = []  # (emotions, filename) for every finished session
     
-    # Process each data point
-    for idx, eeg in enumerate(data_points):
-        # Get p_bad values
-        left_p_bad = eeg.get('Left__p_bad', 1)
-        right_p_bad = eeg.get('Right__p_bad', 1)
-        is_headphone_on = (left_p_bad < 0.5 or right_p_bad < 0.5)
-        
-        # Detect session start
-        if is_headphone_on and (previous_p_bad is None or not previous_p_bad):
-            if previous_p_bad is not None:
-                session_count += 1
-                print(f"\nSESSION {session_count} STARTED (row {idx})")
-            current_session_emotions = []
-        
-        # Detect session end
-        elif not is_headphone_on and previous_p_bad:
-            if current_session_emotions:
-                print(f"SESSION {session_count} ENDED (row {idx})")
-                print(f"   Data points: {len(current_session_emotions)}")
-                
-                # Get unique emotions
-                unique_emotions = list(set(current_session_emotions))
-                print(f"   Unique emotions: {unique_emotions}")
-                
-                # Ask user for their desired emotion for this person
-                user_emotion = input(f"I want to feel: ").strip().capitalize()
-                
-                # Create prompt with all unique emotions + user emotion
-                all_emotions = unique_emotions + [user_emotion]
-                
-                # Create filename
-                emotions_str = "_".join([e.lower() for e in unique_emotions])
-                base_name = f"session{session_count}_{emotions_str}_{user_emotion.lower()}"
-                
-                # Handle duplicates
-                if base_name in filename_counts:
-                    filename_counts[base_name] += 1
-                    filename = f"../radios/{base_name}_{filename_counts[base_name]}.wav"
-                else:
-                    filename_counts[base_name] = 0
-                    filename = f"../radios/{base_name}.wav"
-                
-                print(f"Generating music for {all_emotions}...")
-                generator.generate_music(all_emotions, duration=20, filename=filename)
-                print(f"Saved: {filename}\n")
-                
-                current_session_emotions = []
-        
-        # Process data if headphone is on
-        if is_headphone_on:
-            valence, arousal = processor.extract_features(eeg)
-            eeg_emotion = processor.determine_emotion(valence, arousal)
-            current_session_emotions.append(eeg_emotion)
-            
-            if len(current_session_emotions) % 10 == 0:  # Progress every 10 points
-                print(f"   Session {session_count}: {len(current_session_emotions)} points collected...")
-        
-        previous_p_bad = is_headphone_on
-    
-    # Handle incomplete session at end of file
-    if current_session_emotions and session_count > 0:
-        print(f"SESSION {session_count} INCOMPLETE (reached end of file)")
-        print(f"Data points: {len(current_session_emotions)}")
+    for session, session_emotions in sessions:
+        if session.complete:
+            if session.number > 0:
+                print(f"\nSESSION {session.number} STARTED (row {session.start})")
+            print(f"SESSION {session.number} ENDED (row {session.end})")
+        else:
+            print(f"SESSION {session.number} INCOMPLETE (reached end of file)")
+        print(f"   Data points: {session.end - session.start}")
         
         # Get unique emotions
-        unique_emotions = list(set(current_session_emotions))
-        print(f"Unique emotions: {unique_emotions}")
+        unique_emotions = session_emotions.unique_emotions()
+        print(f"   Unique emotions: {unique_emotions}")
         
-        # Ask user for desired emotion
+        # Ask user for their desired emotion for this person
         user_emotion = input(f"I want to feel: ").strip().capitalize()
         
         # Create prompt with all unique emotions + user emotion
@@ -113,7 +88,7 @@ def process_from_csv(csv_filename):
         
         # Create filename
         emotions_str = "_".join([e.lower() for e in unique_emotions])
-        base_name = f"session{session_count}_{emotions_str}_{user_emotion.lower()}"
+        base_name = f"session{session.number}_{emotions_str}_{user_emotion.lower()}"
         
         # Handle duplicates
         if base_name in filename_counts:
@@ -123,11 +98,19 @@ def process_from_csv(csv_filename):
             filename_counts[base_name] = 0
             filename = f"../radios/{base_name}.wav"
         
-        print(f"Generating music for {all_emotions}...")
-        generator.generate_music(all_emotions, duration=20, filename=filename)
-        print(f"Saved: {filename}\n")
+        jobs.append((all_emotions, filename))
+    
+    # Generate all sessions together as padded batches
+    if jobs:
+        print(f"\nGenerating music for {len(jobs)} sessions (batches of {GENERATION_BATCH_SIZE})...")
+        generator.generate_batch(
+            [emotions for emotions, _ in jobs],
+            duration=20,
+            filenames=[filename for _, filename in jobs],
+            batch_size=GENERATION_BATCH_SIZE,
+        )
     
-    print(f"Processed {session_count} sessions from CSV!")
+    print(f"Processed {len(jobs)} sessions from CSV!")
 
 if __name__ == "__main__":
     import sys
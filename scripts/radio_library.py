@@ -0,0 +1,147 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from brainwave_core import EMOTIONS, MODEL_NAME, INFERENCE_PROFILES
+
+LIBRARY_DIR = "../radios/library"
+VARIATIONS = 3
+SESSION_DURATION = 20    # brainwave_stream.py / process_csv.py clips
+COMMUNITY_DURATION = 30  # community sound clips
+
+def library_combinations():
+    """
+    Every emotion list the warm-up renders, with its duration:
+    each base emotion alone (community mode) and every EEG emotion x target emotion pair.
+    """
+    combos = [([emotion], COMMUNITY_DURATION) for emotion in EMOTIONS]
+    combos += [([eeg, target], SESSION_DURATION) for eeg in EMOTIONS for target in EMOTIONS]
+    return combos
+
+def library_key(emotions, duration):
+    """
+    Manifest key of an emotion list. The EEG emotions come from a set, so their order is not
+    meaningful: they are sorted. The last emotion is the target (as in MusicGenerator.get_prompt).
+    """
+    if len(emotions) > 1:
+        eeg, target = sorted(emotions[:-1]), emotions[-1]
+        return f"{'+'.join(eeg)}>{target}@{duration}"
+    return f"{emotions[0]}@{duration}"
+
+class RadioLibrary:
+    """
+    Pre-rendered clips for common emotion combinations, so a session can get its music instantly.
+    manifest.json maps library_key -> list of variations ({"file", "seed"}).
+    """
+    def __init__(self, library_dir=LIBRARY_DIR):
+        self.library_dir = library_dir
+        self.manifest_path = os.path.join(library_dir, "manifest.json")
+        self.manifest = {}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                self.manifest = json.load(f)
+
+    def lookup(self, emotions, duration):
+        """Returns the path of a random pre-rendered variation, or None."""
+        variations = self.manifest.get(library_key(emotions, duration), [])
+        variations = [v for v in variations if os.path.exists(os.path.join(self.library_dir, v["file"]))]
+        if not variations:
+            return None
+        return os.path.join(self.library_dir, random.choice(variations)["file"])
+
+    def pick(self, emotions, duration, filename):
+        """Copies a pre-rendered clip to filename. Returns False if the combination isn't in the library."""
+        path = self.lookup(emotions, duration)
+        if path is None:
+            return False
+        shutil.copyfile(path, filename)
+        return True
+
+    def _save_manifest(self):
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.manifest, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)
+
+    def warm_up(self, combos=None, variations=VARIATIONS, workers=1, model_name=MODEL_NAME, profile=None):
+        """
+        Renders every combination that doesn't have enough variations yet.
+        Resumable: the manifest is saved after each combination, so an interrupted run picks up where it stopped.
+        Combinations are spread over `workers` processes, each with its own model and a share of the CPU threads.
+        """
+        os.makedirs(self.library_dir, exist_ok=True)
+        if combos is None:
+            combos = library_combinations()
+
+        todo = []
+        for index, (emotions, duration) in enumerate(combos):
+            have = len(self.manifest.get(library_key(emotions, duration), []))
+            if have < variations:
+                todo.append((index, emotions, duration, have))
+
+        total = len(combos)
+        print(f"Library: {total - len(todo)}/{total} combinations already rendered, {len(todo)} to go")
+        if not todo:
+            return
+
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        start = time.time()
+        done = 0
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(threads, model_name, profile)) as pool:
+            futures = {
+                pool.submit(_render, self.library_dir, index, emotions, duration, have, variations): (emotions, duration)
+                for index, emotions, duration, have in todo
+            }
+            for future in as_completed(futures):
+                emotions, duration = futures[future]
+                done += 1
+                try:
+                    rendered = future.result()
+                except Exception as e:
+                    print(f"[{done}/{len(todo)}] Failed {emotions}: {e}")
+                    continue
+                self.manifest.setdefault(library_key(emotions, duration), []).extend(rendered)
+                self._save_manifest()
+
+                elapsed = time.time() - start
+                eta = elapsed / done * (len(todo) - done)
+                print(f"[{done}/{len(todo)}] {library_key(emotions, duration)} ({elapsed:.0f}s elapsed, ~{eta:.0f}s left)")
+
+# One MusicGenerator per worker process
+_generator = None
+
+def _init_worker(threads, model_name, profile):
+    import torch
+    from brainwave_core import MusicGenerator
+    global _generator
+    torch.set_num_threads(threads)
+    _generator = MusicGenerator(model_name, profile=profile)
+
+def _render(library_dir, index, emotions, duration, have, variations):
+    """Renders the missing variations of one combination as a single batch."""
+    slug = library_key(emotions, duration).replace(">", "_to_").replace("+", "_").replace("@", "_").lower()
+    filenames = [f"{slug}_v{v + 1}.wav" for v in range(have, variations)]
+    seed = index * 1000 + have
+    _generator.generate_batch(
+        [emotions] * len(filenames),
+        duration=duration,
+        filenames=[os.path.join(library_dir, name) for name in filenames],
+        seed=seed,
+    )
+    return [{"file": name, "seed": seed} for name in filenames]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-render the radio library of emotion combinations.")
+    parser.add_argument("--variations", type=int, default=VARIATIONS, help="clips per combination")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 1) // 4), help="generator processes")
+    parser.add_argument("--library-dir", default=LIBRARY_DIR)
+    parser.add_argument("--model", default=MODEL_NAME)
+    parser.add_argument("--profile", choices=list(INFERENCE_PROFILES), help="CPU inference profile (default: $BRAINWAVE_PROFILE)")
+    args = parser.parse_args()
+
+    RadioLibrary(args.library_dir).warm_up(
+        variations=args.variations, workers=args.workers, model_name=args.model, profile=args.profile
+    )
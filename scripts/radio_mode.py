@@ -0,0 +1,339 @@
+import argparse
+import asyncio
+import os
+import queue
+import threading
+import time
+import numpy as np
+from brainwave_core import EmotionAggregator, MusicGenerator, MODEL_NAME, check_policy, policy_emotion
+from audio_io import WavStreamWriter, output_channels
+from hub import HubSessions, HubSupervisor, hub_url
+from metrics import metrics
+
+HUB_IP = "your_hub_ip"
+
+# Continuous radio: instead of one clip per session, an endless stream of music that follows
+# the emotions classified from the live EEG stream.
+SEGMENT_SECONDS = 10       # music generated per model call
+PROMPT_SECONDS = 3         # end of the previous segment that the next one continues (MusicGen audio prompt)
+CROSSFADE_SECONDS = 0.5    # overlap over which consecutive segments are blended
+AHEAD_SEGMENTS = 2         # finished segments that may wait ahead of playback (2: double buffering)
+PLAY_BLOCK_SECONDS = 0.5   # audio written per playback step
+REPORT_SECONDS = 5         # buffer health report interval
+
+# Emotions of the frames classified while a segment plays pick the next segment's prompt:
+# their most common emotion, plus the target from this policy ("dominant", "opposite" or "fixed:<Emotion>")
+RADIO_POLICY = "dominant"
+DEFAULT_EMOTIONS = ["Calm"]  # until the first frames are classified
+
+def crossfade(tail, head, equal_power=True):
+    """
+    Blends two equally long (channels, samples) arrays: tail fades out while head fades in.
+    equal_power uses cos/sin gains (constant power for unrelated audio); otherwise the gains are
+    linear, which keeps the level constant when both are (nearly) the same audio.
+    """
+    n = tail.shape[-1]
+    if not n:
+        return head
+    position = (np.arange(n, dtype=np.float32) + 0.5) / n
+    if equal_power:
+        angle = position * np.float32(np.pi / 2)
+        return tail * np.cos(angle) + head * np.sin(angle)
+    return tail * (1 - position) + head * position
+
+def join_segment(held, audio, prompt_samples, fade):
+    """
+    Appends a generated segment (audio (channels, samples), starting with prompt_samples of re-decoded
+    prompt, see MusicGenerator.generate_continuation) to the stream.
+    held is the previous segment's last `fade` samples, not played yet (None for the first segment).
+    With at least `fade` samples of prompt, the end of the prompt is the same stretch of music as held
+    and the two are blended sample for sample; otherwise held fades into the start of the new music.
+    Returns (audio to play, the new held samples).
+    """
+    body_end = audio.shape[-1] - fade
+    if held is None:
+        piece = audio[:, prompt_samples:body_end]
+    elif prompt_samples >= fade:
+        overlap = crossfade(held, audio[:, prompt_samples - fade:prompt_samples], equal_power=False)
+        piece = np.concatenate([overlap, audio[:, prompt_samples:body_end]], axis=1)
+    else:
+        overlap = crossfade(held, audio[:, prompt_samples:prompt_samples + fade])
+        piece = np.concatenate([overlap, audio[:, prompt_samples + fade:body_end]], axis=1)
+    return piece, audio[:, body_end:].copy()
+
+class StopOnEvent:
+    """Stopping criterion (passed to generate) that ends generation early once event is set."""
+    def __init__(self, event):
+        self.event = event
+
+    def __call__(self, input_ids, scores, **kwargs):
+        import torch
+        return torch.full((input_ids.shape[0],), self.event.is_set(), dtype=torch.bool, device=input_ids.device)
+
+class Radio:
+    """
+    Plays generated music without end, following the listener's emotions.
+
+    A generation thread renders segment_seconds at a time. Each segment continues the last
+    prompt_seconds of the previous one (MusicGen's audio prompt), so the music stays coherent while
+    the emotions in the text prompt change, and the segments are crossfaded (join_segment).
+    Finished segments wait in a queue of `ahead` (double buffering) while the playback thread writes
+    audio in real time to `output` (a growing WAV) and/or callback(chunk, sampling_rate), chunk
+    shaped (samples, channels). Playback starts once the first segment is ready, so generation
+    stays a segment or more ahead as long as it runs faster than real time (RTF < 1).
+
+    observe() feeds classified emotions; each segment uses the ones seen since the previous segment.
+    health() reports how much audio is buffered ahead of playback and how often it ran dry.
+    """
+    def __init__(self, generator, segment_seconds=SEGMENT_SECONDS, prompt_seconds=PROMPT_SECONDS,
+                 crossfade_seconds=CROSSFADE_SECONDS, ahead=AHEAD_SEGMENTS, policy=RADIO_POLICY,
+                 output=None, callback=None, realtime=True, seed=None):
+        if crossfade_seconds * 2 >= segment_seconds:
+            raise ValueError("crossfade_seconds must be shorter than half a segment")
+        self.generator = generator
+        self.segment_seconds = segment_seconds
+        self.prompt_seconds = prompt_seconds
+        self.crossfade_seconds = crossfade_seconds
+        self.policy = policy
+        self.output = output
+        self.callback = callback
+        self.realtime = realtime
+        self.seed = seed
+        self.sampling_rate = None
+        self.segments = 0         # segments generated
+        self.underruns = 0        # times playback caught up with generation
+        self.played_samples = 0
+        self._segments = queue.Queue(maxsize=max(1, ahead))
+        self._queued_samples = 0  # in the queue
+        self._playing_samples = 0  # left of the segment being played
+        self._window = EmotionAggregator()
+        self._emotions = list(DEFAULT_EMOTIONS)
+        self._writer = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        for target, name in ((self._generate_loop, "radio-generate"), (self._play_loop, "radio-play")):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self):
+        """Stops playback, abandons the segment being generated and closes the output."""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        if self._writer is not None:
+            self._writer.close()
+            print(f"Radio saved to {self.output} ({self.played_samples / self.sampling_rate:.0f}s)")
+
+    def set_emotions(self, emotions):
+        """Uses these emotions (EEG emotions + target) for the following segments."""
+        with self._lock:
+            self._emotions = list(emotions)
+            self._window.reset()
+
+    def observe(self, emotion, time=None):
+        """Adds a classified frame's emotion (from any thread)."""
+        with self._lock:
+            self._window.add(emotion, time)
+
+    def _next_emotions(self):
+        with self._lock:
+            if self._window.points:
+                self._emotions = [self._window.most_common(), policy_emotion(self.policy, self._window)]
+                self._window.reset()
+            return list(self._emotions)
+
+    @property
+    def played_seconds(self):
+        return self.played_samples / self.sampling_rate if self.sampling_rate else 0.0
+
+    def health(self):
+        with self._lock:
+            buffered = self._queued_samples + self._playing_samples
+        return {
+            "buffer_seconds": buffered / self.sampling_rate if self.sampling_rate else 0.0,
+            "segments_ready": self._segments.qsize(),
+            "played_seconds": self.played_seconds,
+            "underruns": self.underruns,
+            "rtf": self.generator.last_rtf,
+        }
+
+    def _report(self):
+        health = self.health()
+        metrics.set("brainwave_radio_buffer_seconds", health["buffer_seconds"])
+        metrics.set("brainwave_radio_segments_ready", health["segments_ready"])
+        rtf = "?" if health["rtf"] is None else f"{health['rtf']:.2f}"
+        print(f"[radio] {health['played_seconds']:.0f}s played, {health['buffer_seconds']:.1f}s buffered "
+              f"({health['segments_ready']} segments ready), RTF {rtf}, underruns {health['underruns']}")
+        if self.realtime and health["buffer_seconds"] < self.segment_seconds:
+            print("[radio] Less than one segment buffered: generation is falling behind playback")
+
+    def _generate_loop(self):
+        from transformers import StoppingCriteriaList
+        sampling_rate = self.generator.model.config.audio_encoder.sampling_rate  # waits for the model
+        self.sampling_rate = sampling_rate
+        fade = int(self.crossfade_seconds * sampling_rate)
+        prompt_length = int(self.prompt_seconds * sampling_rate)
+        stopping_criteria = StoppingCriteriaList([StopOnEvent(self._stop)])
+        held = tail = None
+        while not self._stop.is_set():
+            emotions = self._next_emotions()
+            seed = None if self.seed is None else self.seed + self.segments
+            try:
+                audio, prompt_samples = self.generator.generate_continuation(
+                    emotions, self.segment_seconds, tail, seed, stopping_criteria=stopping_criteria
+                )
+            except Exception as e:
+                if self._stop.is_set():
+                    break  # stopped mid-segment
+                print(f"[radio] Generation failed: {e}")
+                self._stop.wait(1)
+                continue
+            if self._stop.is_set():
+                break
+            piece, held = join_segment(held, audio, prompt_samples, fade)
+            tail = audio[:, audio.shape[-1] - prompt_length:].copy() if prompt_length else None
+            self.segments += 1
+            print(f"[radio] Segment {self.segments} ready: {emotions}")
+
+            with self._lock:
+                self._queued_samples += piece.shape[1]
+            # Blocks while `ahead` segments are waiting
+            while not self._stop.is_set():
+                try:
+                    self._segments.put(piece, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+
+    def _emit(self, chunk):
+        if self.output and self._writer is None:
+            fmt = self.generator.output_format  # streamed: sample format and downmix only
+            channels = output_channels(fmt, chunk.shape[1])
+            self._writer = WavStreamWriter(self.output, self.sampling_rate, channels, fmt.sample_format, fmt.dither)
+        if self._writer is not None:
+            self._writer.write(chunk)
+        if self.callback is not None:
+            self.callback(chunk, self.sampling_rate)
+
+    def _play_loop(self):
+        clock = None  # wall-clock time at which played_samples was 0
+        starved = True
+        next_report = None
+        while not self._stop.is_set():
+            if next_report is not None and time.monotonic() >= next_report:
+                next_report += REPORT_SECONDS
+                self._report()
+            try:
+                piece = self._segments.get(timeout=0.1)
+            except queue.Empty:
+                piece = None
+            sampling_rate = self.sampling_rate
+            # Up to a block is written ahead: the buffer only runs dry once the wall clock passes its end
+            if self.realtime and not starved and time.monotonic() > clock + self.played_samples / sampling_rate:
+                starved = True
+                self.underruns += 1
+                metrics.inc("brainwave_radio_underruns_total")
+                print("[radio] Buffer ran dry, waiting for the next segment")
+            if piece is None:
+                continue
+
+            block = max(1, int(PLAY_BLOCK_SECONDS * sampling_rate))
+            if starved:
+                # (Re)start the clock: playback resumes now, without catching up on the silence
+                clock = time.monotonic() - self.played_samples / sampling_rate
+                starved = False
+                if next_report is None:
+                    next_report = time.monotonic() + REPORT_SECONDS
+            with self._lock:
+                self._queued_samples -= piece.shape[1]
+                self._playing_samples = piece.shape[1]
+
+            for start in range(0, piece.shape[1], block):
+                if self.realtime:
+                    # Stay one block ahead of the wall clock
+                    delay = clock + self.played_samples / sampling_rate - PLAY_BLOCK_SECONDS - time.monotonic()
+                    if delay > 0 and self._stop.wait(delay):
+                        break
+                chunk = piece[:, start:start + block].T
+                self._emit(chunk)
+                with self._lock:
+                    self.played_samples += len(chunk)
+                    self._playing_samples -= len(chunk)
+                if time.monotonic() >= next_report:
+                    next_report += REPORT_SECONDS
+                    self._report()
+            with self._lock:
+                self._playing_samples = 0
+
+def follow_hub(radio, hub):
+    """A HubSupervisor that feeds the emotions of the person wearing the headset to the radio."""
+    sessions = HubSessions(
+        on_start=lambda hub, number: print(f"\n🎧 SESSION {number} STARTED (the radio follows this person)\n"),
+        on_end=lambda hub, number, session_emotions: print(f"\n🎧 SESSION {number} ENDED (the radio keeps the last emotions)\n"),
+        on_emotion=lambda hub, eeg, emotion, valence, arousal: radio.observe(emotion, eeg.time),
+    )
+    return HubSupervisor(hub, hub_url(hub), sessions.handle, on_gap=sessions.on_gap)
+
+async def main(args):
+    if os.environ.get("BRAINWAVE_SERVER"):
+        print("Note: radio mode continues audio with a local model; $BRAINWAVE_SERVER is not used")
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    generator = MusicGenerator(args.model, background=True)
+    radio = Radio(
+        generator,
+        segment_seconds=args.segment,
+        prompt_seconds=args.prompt,
+        crossfade_seconds=args.crossfade,
+        ahead=args.ahead,
+        policy=args.policy,
+        output=args.output,
+        realtime=not args.no_realtime,
+        seed=args.seed,
+    )
+
+    hub_task = None
+    if args.emotions:
+        radio.set_emotions([e.strip().capitalize() for e in args.emotions.split(",")])
+    else:
+        print(f"Connecting to {args.hub}")
+        hub_task = asyncio.create_task(follow_hub(radio, args.hub).run())
+    radio.start()
+    print(f"Radio playing into {args.output}" + (f" for {args.minutes:g} minutes" if args.minutes else " (Ctrl+C to stop)"))
+
+    try:
+        while not args.minutes or radio.played_seconds < args.minutes * 60:
+            if hub_task is not None and hub_task.done():
+                break
+            await asyncio.sleep(0.5)
+    finally:
+        if hub_task is not None:
+            hub_task.cancel()
+            await asyncio.gather(hub_task, return_exceptions=True)
+        await asyncio.to_thread(radio.stop)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Endless music that follows the live EEG emotions.")
+    parser.add_argument("--hub", default=HUB_IP, help="hub address (default: HUB_IP)")
+    parser.add_argument("--emotions", help="play for fixed emotions instead of a hub, e.g. Calm,Relaxed")
+    parser.add_argument("--policy", type=check_policy, default=RADIO_POLICY,
+                        help="target emotion added to the prompt: dominant, opposite or fixed:<Emotion>")
+    parser.add_argument("--output", default="../radios/radio.wav", help="growing WAV the radio plays into")
+    parser.add_argument("--minutes", type=float, default=0, help="stop after this much music (default: never)")
+    parser.add_argument("--segment", type=float, default=SEGMENT_SECONDS, help="seconds generated per model call")
+    parser.add_argument("--prompt", type=float, default=PROMPT_SECONDS,
+                        help="seconds of the previous segment each one continues (0: independent segments)")
+    parser.add_argument("--crossfade", type=float, default=CROSSFADE_SECONDS, help="seconds blended between segments")
+    parser.add_argument("--ahead", type=int, default=AHEAD_SEGMENTS, help="finished segments kept ready ahead of playback")
+    parser.add_argument("--no-realtime", action="store_true", help="write as fast as generated (render a mix)")
+    parser.add_argument("--seed", type=int, help="sampling seed (segment n uses seed + n)")
+    parser.add_argument("--model", default=MODEL_NAME)
+    args = parser.parse_args()
+    try:
+        asyncio.run(main(args))
+    except KeyboardInterrupt:
+        pass
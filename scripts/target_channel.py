@@ -0,0 +1,66 @@
+import asyncio
+import sys
+import threading
+
+# Seconds the operator has to answer before the session's default target is used (0: never ask)
+TARGET_TIMEOUT = 30
+
+class TargetChannel:
+    """
+    Asks the operator for a session's target emotion without blocking the event loop.
+
+    A daemon thread reads stdin lines into an asyncio.Queue, and ask() waits for the next line
+    for at most `timeout` seconds. An empty line, the timeout, a closed stdin or timeout=0
+    (headless) give the default. Questions are asked one at a time. Lines typed before a
+    question are dropped, so an answer always belongs to the question it follows.
+    """
+    def __init__(self, timeout=TARGET_TIMEOUT, stream=None):
+        self.timeout = timeout
+        self._stream = stream or sys.stdin
+        self._queue = None
+        self._lock = asyncio.Lock()
+        self._closed = False
+
+    def start(self):
+        """Starts the stdin reader. Call from the running event loop."""
+        if self.timeout and self._queue is None:
+            loop = asyncio.get_running_loop()
+            self._queue = asyncio.Queue()
+            threading.Thread(target=self._read, args=(loop,), name="target-input", daemon=True).start()
+        return self
+
+    def _read(self, loop):
+        try:
+            for line in self._stream:
+                loop.call_soon_threadsafe(self._queue.put_nowait, line)
+            loop.call_soon_threadsafe(self._queue.put_nowait, None)  # end of input
+        except RuntimeError:
+            pass  # the event loop is gone (shutting down)
+
+    def close(self):
+        """Questions waiting now, and any asked later, get their default right away."""
+        self._closed = True
+        if self._queue is not None:
+            self._queue.put_nowait(None)
+
+    async def ask(self, question, default):
+        if not self.timeout or self._queue is None or self._closed:
+            return default
+        async with self._lock:
+            # Drop lines typed before the question
+            while not self._queue.empty():
+                if self._queue.get_nowait() is None:
+                    self._closed = True
+            if self._closed:
+                return default
+
+            print(f"{question} [{default}, {self.timeout:g}s]: ", end="", flush=True)
+            try:
+                line = await asyncio.wait_for(self._queue.get(), self.timeout)
+            except asyncio.TimeoutError:
+                print(f"\nNo answer within {self.timeout:g}s, using {default}")
+                return default
+            if line is None:
+                self._closed = True
+                return default
+            return line.strip().capitalize() or default
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+from brainwave_core import BandSmoother
+
+# smooth_batch() over chunks, with restarts, must give the values push() gives frame by frame
+
+def streamed(smoother, bands, restart):
+    out = []
+    for row, fresh in zip(bands, restart):
+        if fresh:
+            smoother.reset()
+        out.append(np.array(smoother.push(row), dtype=np.float64))
+    return np.array(out)
+
+def batched(smoother, bands, restart, splits):
+    bounds = [0] + list(splits) + [len(bands)]
+    return np.concatenate([
+        smoother.smooth_batch(bands[start:end], restart[start:end]) for start, end in zip(bounds[:-1], bounds[1:])
+    ])
+
+def frames(rng, n):
+    bands = rng.uniform(0.01, 1.0, (n, 4))
+    bands[rng.random(n) < 0.15, rng.integers(0, 4)] = np.nan  # missing bands
+    bands[:2] = np.nan                                         # before any valid frame
+    return bands
+
+@pytest.mark.parametrize("method", BandSmoother.METHODS)
+@pytest.mark.parametrize("window", [1, 4, 16])
+@pytest.mark.parametrize("seed", range(4))
+def test_chunked_batch_matches_streaming(method, window, seed):
+    rng = np.random.default_rng(seed)
+    n = 200
+    bands = frames(rng, n)
+    restart = rng.random(n) < 0.05
+    restart[rng.integers(0, n)] = True
+    bands[np.flatnonzero(restart)[0]] = np.nan  # a missing frame right after a restart
+    splits = np.sort(rng.choice(np.arange(1, n), size=6, replace=False))
+
+    expected = streamed(BandSmoother(method, window), bands, restart)
+    np.testing.assert_allclose(batched(BandSmoother(method, window), bands, restart, splits), expected, rtol=1e-12)
+    np.testing.assert_allclose(BandSmoother(method, window).smooth_batch(bands, restart), expected, rtol=1e-12)
+
+@pytest.mark.parametrize("method", BandSmoother.METHODS)
+def test_state_carries_from_batch_to_push(method):
+    rng = np.random.default_rng(0)
+    bands = frames(rng, 50)
+    restart = np.zeros(50, dtype=bool)
+    expected = streamed(BandSmoother(method, 8), bands, restart)
+
+    smoother = BandSmoother(method, 8)
+    head = smoother.smooth_batch(bands[:30], restart[:30])
+    tail = streamed(smoother, bands[30:], restart[30:])
+    np.testing.assert_allclose(np.concatenate([head, tail]), expected, rtol=1e-12)
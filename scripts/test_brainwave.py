@@ -1,6 +1,7 @@
 import time
 import os
-from brainwave_core import EEGProcessor, MusicGenerator
+from brainwave_core import EEGProcessor
+from generation_server import make_generator
 
 def test_data():
     # Data provided by user
@@ -10,7 +11,7 @@ def test_data():
     ]
 
     processor = EEGProcessor()
-    generator = MusicGenerator()
+    generator = make_generator()
     
     # Create radios folder if it doesn't exist
     os.makedirs("../radios", exist_ok=True)
@@ -0,0 +1,75 @@
+import asyncio
+import json
+from collections import Counter
+import websockets
+from brainwave_core import EEGFrame, EEGProcessor
+from community_sound import collect_sessions
+
+# collect_sessions against several local fake hubs, one of which stalls and one of which dies
+
+# Left/right alpha, left/right beta giving the emotion they're named after
+BANDS = {
+    "calm": (0.6, 0.2, 0.1, 0.1),
+    "excited": (0.05, 0.2, 0.9, 0.1),
+    "tense": (0.3, 0.3, 0.3, 0.3),
+}
+
+def frame(time, p_bad, bands=BANDS["tense"]):
+    left_alpha, right_alpha, left_beta, right_beta = bands
+    return json.dumps({
+        "time": time, "Left__p_bad": p_bad, "Right__p_bad": p_bad,
+        "Left__alpha": left_alpha, "Right__alpha": right_alpha,
+        "Left__beta": left_beta, "Right__beta": right_beta,
+    })
+
+def session(start, bands, length=5):
+    """Frames for one person: headphone on for `length` frames, then off."""
+    frames = [frame(start + i * 0.1, 0.0, bands) for i in range(length)]
+    return frames + [frame(start + length * 0.1, 1.0)]
+
+def emotion(bands):
+    processor = EEGProcessor(smoothing="")
+    return processor.determine_emotion(*processor.extract_features(EEGFrame(0, *bands, 0, 0)))
+
+async def serve(handler):
+    server = await websockets.serve(handler, "127.0.0.1", 0)
+    return server, f"ws://127.0.0.1:{server.sockets[0].getsockname()[1]}"
+
+async def run_hubs(num_sessions):
+    servers = {}
+
+    async def steady(ws):
+        # Two people, then an idle (but open) connection
+        for msg in [frame(0, 1.0)] + session(1, BANDS["calm"]) + session(2, BANDS["excited"]):
+            await ws.send(msg)
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(3600)
+
+    async def stalls(ws):
+        # One person, then no more frames
+        for msg in [frame(0, 1.0)] + session(1, BANDS["tense"]):
+            await ws.send(msg)
+        await asyncio.sleep(3600)
+
+    async def dies(ws):
+        # Half a session, then the hub goes away for good (reconnects are refused)
+        for msg in [frame(0, 1.0)] + session(1, BANDS["excited"])[:3]:
+            await ws.send(msg)
+        servers["dies"].close()
+
+    urls = []
+    for name, handler in (("steady", steady), ("stalls", stalls), ("dies", dies)):
+        servers[name], url = await serve(handler)
+        urls.append(url)
+    try:
+        return await asyncio.wait_for(collect_sessions(urls, num_sessions), timeout=20)
+    finally:
+        for server in servers.values():
+            server.close()
+
+def test_sessions_from_all_live_hubs_are_merged():
+    people, emotion_counts = asyncio.run(run_hubs(num_sessions=3))
+
+    assert people == 3
+    expected = Counter([emotion(BANDS["calm"]), emotion(BANDS["excited"]), emotion(BANDS["tense"])])
+    assert emotion_counts == expected
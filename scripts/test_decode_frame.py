@@ -0,0 +1,53 @@
+import json
+import math
+import pytest
+from brainwave_core import FrameError, decode_frame
+
+FRAME = {
+    "time": 1.5, "Left__alpha": 0.1, "Right__alpha": 0.2, "Left__beta": 0.3, "Right__beta": 0.4,
+    "Left__p_bad": 0.0, "Right__p_bad": 0.1, "Left__gamma": 3e-5,
+}
+
+def without(name):
+    return {key: value for key, value in FRAME.items() if key != name}
+
+@pytest.mark.parametrize("msg", [
+    "{oops}",
+    "{}",
+    '{"Left__alpha": 0.1,,}',
+    json.dumps(FRAME)[:-20] + "}",                     # truncated
+    json.dumps(FRAME) + "}",
+    json.dumps(FRAME).replace(", ", " ", 1),           # missing comma
+    json.dumps(FRAME).replace("0.3", "0.3abc"),
+    json.dumps(FRAME).replace("0.1,", "1_000,", 1),
+    json.dumps(without("Right__beta")),
+    json.dumps(without("Left__p_bad")),
+    json.dumps(dict(FRAME, Left__p_bad="x")),
+    json.dumps(dict(FRAME, Left__p_bad=True)),
+    json.dumps(dict(FRAME, Left__alpha=None)),
+    json.dumps(dict(FRAME, meta={"hub": 1}, Left__alpha="0.1")),
+    "[1, 2]",
+])
+def test_malformed_frames_are_rejected(msg):
+    with pytest.raises(FrameError):
+        decode_frame(msg)
+
+@pytest.mark.parametrize("data", [
+    FRAME,
+    dict(FRAME, time=None),
+    without("time"),
+    dict(FRAME, meta={"hub": "x"}, name="s"),          # not flat: decoded with json.loads
+    dict(FRAME, Left__alpha=1, Left__beta=-2.5e-7),
+])
+@pytest.mark.parametrize("indent", [None, 1])
+def test_frames_decode(data, indent):
+    frame = decode_frame(json.dumps(data, indent=indent))
+    assert frame.time == data.get("time")
+    assert frame.left_alpha == data["Left__alpha"]
+    assert frame.left_beta == data["Left__beta"]
+    assert (frame.left_p_bad, frame.right_p_bad) == (data["Left__p_bad"], data["Right__p_bad"])
+
+def test_non_finite_values_decode():
+    frame = decode_frame(json.dumps(dict(FRAME, Left__alpha=float("nan"), Right__alpha=float("-inf"))).encode())
+    assert math.isnan(frame.left_alpha)
+    assert frame.right_alpha == -math.inf
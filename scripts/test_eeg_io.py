@@ -0,0 +1,76 @@
+import os
+import numpy as np
+import pandas as pd
+from eeg_io import BinaryRecording, BinaryRecordingWriter, CSVAppendWriter, binary_to_csv, csv_to_binary, load_csv
+
+# CSV <-> binary recordings must round-trip without changing a value
+
+SAMPLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "sample_happy.csv")
+
+def assert_same_values(expected, actual):
+    assert sorted(actual.columns) == sorted(expected.columns)
+    pd.testing.assert_frame_equal(
+        actual[sorted(actual.columns)], expected[sorted(expected.columns)], check_dtype=False, check_exact=True,
+    )
+
+def round_trip(csv_filename, tmp_path, chunk_rows):
+    path = csv_to_binary(csv_filename, str(tmp_path / "recording.eeg"), chunk_rows=chunk_rows)
+    return BinaryRecording(path), load_csv(binary_to_csv(path, str(tmp_path / "back.csv"), chunk_rows=chunk_rows))
+
+def test_sample_round_trip(tmp_path):
+    original = load_csv(SAMPLE)
+    recording, back = round_trip(SAMPLE, tmp_path, chunk_rows=4)
+
+    assert len(recording) == len(original)
+    for name in original.columns:
+        assert np.array_equal(recording[name], original[name].to_numpy())
+    assert_same_values(original, back)
+
+def rows():
+    """An int column that gets a float value later on, and a column that first appears mid-run."""
+    for i in range(12):
+        row = {"time": 1732310000.1 + i * 0.1, "Left__p_bad": 0.1 * i, "count": i}
+        if i == 7:
+            row["count"] = 7.5
+        if i >= 5:
+            row["label"] = f"person {i}"
+            row["Right__alpha"] = 1 / (i + 3)
+        yield row
+
+def test_csv_round_trip_widens_and_back_fills(tmp_path):
+    csv_filename = str(tmp_path / "recording.csv")
+    with CSVAppendWriter(csv_filename) as writer:  # rolls over to a second segment at row 5
+        for row in rows():
+            writer.write(row)
+    original = load_csv(csv_filename)
+    recording, back = round_trip(csv_filename, tmp_path, chunk_rows=3)
+
+    assert recording.schema[recording.columns.index("count")]["dtype"] == "<f8"
+    assert np.isnan(recording["Right__alpha"][:5]).all()
+    assert list(recording["label"][:5]) == [None] * 5
+    assert_same_values(original, back)
+
+def test_writer_widens_and_back_fills(tmp_path):
+    path = str(tmp_path / "recording.eeg")
+    with BinaryRecordingWriter(path, flush_every=3) as writer:  # "count" is on disk as int64 before 7.5 arrives
+        for row in rows():
+            writer.write(row)
+    recording = BinaryRecording(path)
+    expected = pd.DataFrame(list(rows()))
+
+    assert list(recording["count"]) == list(expected["count"])
+    assert recording["count"].dtype == np.float64
+    assert np.isnan(recording["Right__alpha"][:5]).all()
+    assert list(recording["Right__alpha"][5:]) == list(expected["Right__alpha"][5:])
+    assert list(recording["time"]) == list(expected["time"])
+    assert list(recording["label"]) == [None] * 5 + list(expected["label"][5:])
+
+    back = load_csv(binary_to_csv(path, str(tmp_path / "back.csv")))
+    assert_same_values(expected, back)
+
+def test_int_column_stays_int(tmp_path):
+    path = str(tmp_path / "recording.eeg")
+    with BinaryRecordingWriter(path, flush_every=2) as writer:
+        for i in range(5):
+            writer.write({"time": float(i), "count": i})
+    assert BinaryRecording(path)["count"].dtype == np.int64
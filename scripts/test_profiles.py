@@ -0,0 +1,41 @@
+import os
+import subprocess
+import sys
+import pytest
+from benchmark import build_tiny_musicgen
+from brainwave_core import INFERENCE_PROFILES, MusicGenerator
+from audio_io import read_wav
+
+# Every inference profile, on a tiny random MusicGen built locally (nothing is downloaded)
+
+@pytest.fixture(scope="module")
+def tiny_model(tmp_path_factory):
+    return build_tiny_musicgen(str(tmp_path_factory.mktemp("tiny-musicgen")))
+
+@pytest.mark.parametrize("profile", list(INFERENCE_PROFILES))
+def test_profile_generates(tiny_model, tmp_path, profile):
+    generator = MusicGenerator(tiny_model, profile=profile)
+    assert generator.last_rtf is None
+    filename = str(tmp_path / "clip.wav")
+    generator.generate_music(["Calm", "Happy"], duration=1, filename=filename, seed=0)
+
+    audio, sampling_rate = read_wav(filename)
+    assert sampling_rate == generator.model.config.audio_encoder.sampling_rate
+    assert len(audio) > 0
+    assert generator.last_rtf is not None and generator.last_rtf > 0
+
+def test_thread_overrides(tiny_model):
+    # Inter-op threads can be set only once per process, so load in a fresh one
+    code = (
+        "import torch\n"
+        "from brainwave_core import MusicGenerator\n"
+        f"MusicGenerator({tiny_model!r}).generate_music(['Calm'], duration=1, filename='/dev/null')\n"
+        "print(torch.get_num_threads(), torch.get_num_interop_threads())\n"
+    )
+    env = dict(os.environ, BRAINWAVE_THREADS="2", BRAINWAVE_INTEROP_THREADS="3")
+    result = subprocess.run(
+        [sys.executable, "-c", code], env=env, capture_output=True, text=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.splitlines()[-1] == "2 3"
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+from brainwave_core import Session, SessionSegmenter
+
+# push() (streaming) and segment() (offline) must find the same sessions
+
+def streamed(segmenter, left, right):
+    segmenter.reset()
+    sessions = []
+    for left_p_bad, right_p_bad in zip(left, right):
+        event = segmenter.push(left_p_bad, right_p_bad)
+        if event and event.kind == "end":
+            sessions.append(Session(event.number, event.start, event.end, True))
+    last = segmenter.finish()
+    return sessions + ([last] if last else [])
+
+def p_bad(rng, n, on_at_start):
+    """Runs of worn (p_bad near 0), dead-band (0.5-0.8) and off (near 1) frames, one side sometimes flat."""
+    values = []
+    level = 0.0 if on_at_start else 1.0
+    while len(values) < n:
+        values += [level + rng.uniform(-0.05, 0.05)] * int(rng.integers(1, 8))
+        level = rng.choice([0.0, 0.6, 0.7, 1.0])
+    return np.clip(values[:n], 0, 1)
+
+@pytest.mark.parametrize("on_threshold, off_threshold", [(0.5, None), (0.5, 0.75), (0.65, 0.9)])
+@pytest.mark.parametrize("min_points", [1, 3])
+@pytest.mark.parametrize("on_at_start", [True, False])
+@pytest.mark.parametrize("seed", range(5))
+def test_streaming_matches_offline(on_threshold, off_threshold, min_points, on_at_start, seed):
+    rng = np.random.default_rng(seed)
+    left = p_bad(rng, 300, on_at_start)
+    right = np.where(rng.random(300) < 0.5, 1.0, p_bad(rng, 300, on_at_start))
+    segmenter = SessionSegmenter(on_threshold, off_threshold, min_points)
+
+    offline = segmenter.segment(left, right)
+    assert streamed(segmenter, left, right) == offline
+    if on_at_start and min_points == 1:
+        assert offline[0].number == 0 and offline[0].start == 0
+
+def test_session_running_at_first_row():
+    segmenter = SessionSegmenter(min_points=2)
+    left = [0.0, 0.0, 1.0, 0.0, 1.0, 0.0, 0.0, 0.0]
+    right = [1.0] * len(left)
+    expected = [Session(0, 0, 2, True), Session(1, 5, 8, False)]  # the 1-frame run at row 3 is dropped
+    assert segmenter.segment(left, right) == expected
+    assert streamed(segmenter, left, right) == expected
+
+def test_hysteresis_holds_in_dead_band():
+    segmenter = SessionSegmenter(on_threshold=0.5, off_threshold=0.8)
+    left = [1.0, 0.2, 0.7, 0.7, 0.9, 0.7, 0.3]
+    right = [1.0] * len(left)
+    expected = [Session(1, 1, 4, True), Session(2, 6, 7, False)]  # 0.7 after off stays off
+    assert segmenter.segment(left, right) == expected
+    assert streamed(segmenter, left, right) == expected